@@ -0,0 +1,182 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from common.cache import get_tag_versions
+from common.conditional import (get_not_modified_response, make_etag,
+                                set_validators)
+
+
+class ConditionalRetrieveMixin:
+    """
+    Answers retrieve requests with 304 when the ETag or Last-Modified sent
+    by the client matches the object, before it is serialized.
+
+    Last-Modified is only sent while `updated_at` covers everything the
+    representation shows, views that also serialize counters or related
+    objects return None from `get_object_last_modified` and rely on the ETag.
+    """
+
+    def get_object_etag(self, instance):
+        return make_etag(instance.pk, instance.updated_at, self.request.accepted_media_type)
+
+    def get_object_last_modified(self, instance):
+        return instance.updated_at
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = self.get_object_etag(instance), self.get_object_last_modified(instance)
+
+        response = get_not_modified_response(request, etag, last_modified)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        return set_validators(response, etag, last_modified)
+
+
+class ConditionalListMixin:
+    """
+    Answers list requests with 304 while none of `list_cache_tags` is
+    invalidated, the ETag is made of the tag versions and the request,
+    so it is computed without querying the database.
+    """
+    list_cache_tags = ()
+
+    def get_list_etag(self, request):
+        return make_etag(
+            get_tag_versions(*self.list_cache_tags),
+            request.get_full_path(),
+            request.accepted_media_type,
+            request.user.pk,
+        )
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+
+        response = get_not_modified_response(request, etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag)
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients pick the fields of responses with `?fields=` or drop some
+    with `?omit=`, comma separated. Actions listed in `summary_actions`
+    use `summary_serializer_class` unless the fields are picked explicitly.
+
+    Querysets join only the relations and load only the columns that the
+    serializer reads, plus `loaded_fields` used by the view itself.
+    """
+    summary_serializer_class = None
+    summary_actions = ('list',)
+    loaded_fields = ('pk',)
+
+    def get_fieldset(self) -> dict:
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return {}
+        fieldset = {}
+        for param in ('fields', 'omit'):
+            names = [
+                name.strip()
+                for value in self.request.query_params.getlist(param)
+                for name in value.split(',') if name.strip()
+            ]
+            if names:
+                fieldset[param] = names
+        return fieldset
+
+    def get_serializer_class(self):
+        summary = self.action in self.summary_actions and not self.get_fieldset().get('fields')
+        if summary and self.summary_serializer_class:
+            return self.summary_serializer_class
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **self.get_fieldset(), **kwargs)
+
+    def get_serialized_fields(self, model) -> tuple:
+        """Returns names of the concrete fields read by the serializer and of the relations among them to join."""
+        columns, relations = set(), []
+        for field in self.get_serializer().fields.values():
+            if field.write_only or field.source == '*':
+                continue
+            try:
+                model_field = model._meta.get_field(field.source.split('.')[0])
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete:
+                columns.add(model_field.name)
+                if model_field.many_to_one or model_field.one_to_one:
+                    relations.append(model_field.name)
+        return columns, relations
+
+    def select_serialized_fields(self, queryset):
+        """Joins the serialized relations and, for reads, defers the columns the serializer does not read."""
+        columns, relations = self.get_serialized_fields(queryset.model)
+        queryset = queryset.select_related(*relations)
+        if self.request.method in SAFE_METHODS:
+            queryset = queryset.only(*columns, *self.loaded_fields)
+        return queryset
+
+
+class BulkCreateUpdateMixin:
+    """
+    Adds a `bulk` action which creates (POST) or partially updates (PATCH)
+    a list of objects, updated items are identified by `id`. The items are
+    validated together and written in a single transaction, if any of
+    them is invalid nothing is written and errors are listed per item.
+
+    Models whose items can not be created from JSON, e.g. with required
+    files, leave POST out of `bulk_methods`.
+    """
+    bulk_max_items = 500
+    bulk_methods = ('post', 'patch')
+
+    def get_bulk_instances(self, data) -> list:
+        """Returns the objects to update in the order of the items."""
+        # Too long or malformed payloads are rejected by the list serializer.
+        if not isinstance(data, list) or len(data) > self.bulk_max_items:
+            return []
+
+        ids = [item.get('id') if isinstance(item, dict) else None for item in data]
+        instances = self.get_queryset().in_bulk([pk for pk in ids if isinstance(pk, int)])
+        errors, seen_ids = [], set()
+        for pk in ids:
+            if not isinstance(pk, int):
+                errors.append({'id': ['A valid integer is required.']})
+            elif pk not in instances:
+                errors.append({'id': [f'Invalid pk "{pk}" - object does not exist.']})
+            elif pk in seen_ids:
+                errors.append({'id': [f'Duplicate pk "{pk}".']})
+            else:
+                errors.append({})
+            seen_ids.add(pk)
+        if any(errors):
+            raise ValidationError(errors)
+        return [instances[pk] for pk in ids]
+
+    @action(detail=False, methods=('post', 'patch'))
+    def bulk(self, request, *args, **kwargs):
+        if request.method.lower() not in self.bulk_methods:
+            raise MethodNotAllowed(request.method)
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=request.data, many=True, max_length=self.bulk_max_items)
+        else:
+            serializer = self.get_serializer(
+                self.get_bulk_instances(request.data),
+                data=request.data,
+                many=True,
+                partial=True,
+                max_length=self.bulk_max_items,
+            )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK,
+        )
@@ -1,5 +1,161 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import reduce
+from operator import or_
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+@dataclass(frozen=True)
+class Cursor:
+    values: tuple
+    reverse: bool = False
+
+
+class KeysetPaginationMixin:
+    """
+    Adds keyset pagination to a page number pagination class.
+
+    Keyset pagination is used once the request asks for it with
+    `?pagination=cursor` or passes a `cursor`, or by default when
+    `default_pagination` is 'cursor' and no `page` is requested. Pages are then fetched
+    with a `WHERE (ordering fields) > (last row values)` condition
+    instead of `OFFSET` and no `COUNT(*)` query is made. The ordering
+    must end with a unique field, so that every row has its own position.
+    """
+    keyset_ordering = ('-created_date', 'id')
+    cursor_query_param = 'cursor'
+    pagination_query_param = 'pagination'
+    default_pagination = 'page'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_keyset_requested(self, request):
+        params = request.query_params
+        if self.cursor_query_param in params:
+            return True
+        if self.pagination_query_param in params:
+            return params[self.pagination_query_param] == 'cursor'
+        return self.default_pagination == 'cursor' and self.page_query_param not in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_keyset = isinstance(queryset, QuerySet) and self.is_keyset_requested(request)
+        if not self.use_keyset:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_queryset_by_keyset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.use_keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def _get_ordering_fields(self, reverse=False):
+        """Returns (field name, descending) pairs of the keyset ordering."""
+        return [
+            (field.lstrip('-'), field.startswith('-') != reverse)
+            for field in self.keyset_ordering
+        ]
+
+    def _get_keyset_filter(self, values, reverse):
+        """
+        Builds the condition selecting rows placed after the cursor, e.g.
+        `name > x OR (name = x AND id > y)` for the `(name, id)` ordering.
+        """
+        ordering_fields = self._get_ordering_fields(reverse)
+        conditions = []
+        for position, (field, descending) in enumerate(ordering_fields):
+            lookup = 'lt' if descending else 'gt'
+            equal_fields = {name: value for (name, _), value in zip(ordering_fields[:position], values)}
+            conditions.append(Q(**equal_fields, **{f'{field}__{lookup}': values[position]}))
+        return reduce(or_, conditions)
+
+    def get_cursor_values(self, instance) -> list:
+        return [
+            instance._meta.get_field(field).value_to_string(instance)
+            for field, _ in self._get_ordering_fields()
+        ]
+
+    def encode_cursor(self, cursor: Cursor) -> str:
+        data = json.dumps({'v': list(cursor.values), 'r': cursor.reverse}, separators=(',', ':'))
+        return urlsafe_b64encode(data.encode()).decode()
+
+    def get_cursor(self, instance) -> str:
+        """Returns the cursor of the page that starts right after the instance."""
+        return self.encode_cursor(Cursor(values=tuple(self.get_cursor_values(instance))))
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            raw_values = data['v']
+            ordering_fields = self._get_ordering_fields()
+            if len(raw_values) != len(ordering_fields):
+                raise ValueError
+            values = tuple(
+                model._meta.get_field(field).to_python(value)
+                for (field, _), value in zip(ordering_fields, raw_values)
+            )
+            return Cursor(values=values, reverse=bool(data.get('r')))
+        except (BinasciiError, UnicodeDecodeError, ValueError, TypeError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset_by_keyset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = cursor.reverse if cursor else False
+
+        ordering = [
+            f'-{field}' if descending else field
+            for field, descending in self._get_ordering_fields(reverse)
+        ]
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            queryset = queryset.filter(self._get_keyset_filter(cursor.values, reverse))
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = True if reverse else has_more
+        self.has_previous = has_more if reverse else cursor is not None
+        self.first_instance = results[0] if results else None
+        self.last_instance = results[-1] if results else None
+        return results
+
+    def _get_cursor_link(self, instance, reverse):
+        if instance is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        cursor = Cursor(values=tuple(self.get_cursor_values(instance)), reverse=reverse)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(cursor))
+
+    def get_next_link(self):
+        if not self.use_keyset:
+            return super().get_next_link()
+        return self._get_cursor_link(self.last_instance, reverse=False) if self.has_next else None
+
+    def get_previous_link(self):
+        if not self.use_keyset:
+            return super().get_previous_link()
+        return self._get_cursor_link(self.first_instance, reverse=True) if self.has_previous else None
 
 
 class CategoryPageNumberPagination(PageNumberPagination):
@@ -8,13 +164,26 @@ class CategoryPageNumberPagination(PageNumberPagination):
     max_page_size = 48
 
 
-class RecipePageNumberPagination(PageNumberPagination):
+class RecipePageNumberPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = settings.RECIPES_PAGINATE_BY
     page_size_query_param = 'page_size'
     max_page_size = 32
+    keyset_ordering = ('name', 'id')
 
 
-class CommentPageNumberPagination(PageNumberPagination):
+class CommentPageNumberPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = settings.COMMENTS_PAGINATE_BY
     page_size_query_param = 'page_size'
     max_page_size = 12
+    keyset_ordering = ('-created_date', 'id')
+
+
+class BookmarkPageNumberPagination(KeysetPaginationMixin, PageNumberPagination):
+    page_size = settings.RECIPES_PAGINATE_BY
+    page_size_query_param = 'page_size'
+    max_page_size = 32
+    keyset_ordering = ('-created_date', 'id')
+
+
+class BookmarkCursorPagination(BookmarkPageNumberPagination):
+    default_pagination = 'cursor'
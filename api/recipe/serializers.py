@@ -1,9 +1,15 @@
 
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
 
 from api.accounts.serializers import UserSerializer
 from interactions.models import RecipeBookmark, RecipeComment
+from recipe.images import IMAGE_FORMATS, get_srcset
 from recipe.models import Category, Ingredient, Recipe
+from recipe.signals import post_bulk_save
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -12,42 +18,153 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'slug')
 
 
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    Writes all the items with one `bulk_create` or `bulk_update` and sends
+    a single `post_bulk_save` once the transaction is committed.
+    """
+    update_fields = ()
+    batch_size = 500
+
+    @property
+    def model(self):
+        return self.child.Meta.model
+
+    def _send_post_bulk_save(self, instances, created):
+        transaction.on_commit(lambda: post_bulk_save.send(sender=self.model, instances=instances, created=created))
+
+    def create(self, validated_data):
+        instances = [self.model(**attrs) for attrs in validated_data]
+        instances = self.model.objects.bulk_create(instances, batch_size=self.batch_size)
+        self._send_post_bulk_save(instances, created=True)
+        return instances
+
+    def update(self, instances, validated_data):
+        fields = set(self.update_fields)
+        for instance, attrs in zip(instances, validated_data):
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+            fields.update(attrs)
+        if fields:
+            self.model.objects.bulk_update(instances, fields, batch_size=self.batch_size)
+        self._send_post_bulk_save(instances, created=False)
+        return instances
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     recipe_id = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all(), source='recipe')
 
     class Meta:
+        list_serializer_class = BulkListSerializer
         model = Ingredient
         fields = ('id', 'name', 'recipe_id')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Narrows down the fields of the serializer to `fields` or drops the `omit` ones."""
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for param, names in (('fields', fields), ('omit', omit)):
+            unknown = set(names or ()) - set(self.fields)
+            if unknown:
+                raise ValidationError({param: f'Unknown fields: {", ".join(sorted(unknown))}.'})
+
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in omit or ():
+            self.fields.pop(name)
+
+
+class RecipeListSerializer(BulkListSerializer):
+    """
+    Loads categories and ingredients of all the recipes with one query each,
+    relations that are already loaded, e.g. from a snapshot, are skipped.
+    """
+    prefetch_fields = ('category', 'ingredient_set')
+    update_fields = ('updated_at',)
+
+    def get_prefetch_fields(self) -> list:
+        sources = {field.source for field in self.child.fields.values() if not field.write_only}
+        return [name for name in self.prefetch_fields if name in sources]
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        prefetch_related_objects(recipes, *self.get_prefetch_fields())
+        return super().to_representation(recipes)
+
+    def update(self, instances, validated_data):
+        updated_at = timezone.now()
+        for instance in instances:
+            instance.updated_at = updated_at
+        return super().update(instances, validated_data)
+
+
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """Represents image variants as `srcset` values per format, empty until the variants are created."""
+
+    def __init__(self, storage, **kwargs):
+        self.storage = storage
+        super().__init__(**kwargs)
+
+    def get_url(self, name) -> str:
+        request = self.context.get('request')
+        url = self.storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def to_representation(self, value):
+        srcsets = {extension: get_srcset(value, extension, self.get_url) for extension in IMAGE_FORMATS}
+        return {extension: srcset for extension, srcset in srcsets.items() if srcset}
+
+
+class RecipeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         write_only=True, queryset=Category.objects.all(), source='category'
     )
-    ingredients = serializers.SerializerMethodField(read_only=True)
-    bookmarks_count = serializers.SerializerMethodField(read_only=True)
-
-    @staticmethod
-    def get_ingredients(obj):
-        return IngredientSerializer(Ingredient.objects.filter(recipe=obj), many=True).data
-
-    @staticmethod
-    def get_bookmarks_count(obj):
-        return obj.bookmarks.count()
+    ingredients = IngredientSerializer(source='ingredient_set', many=True, read_only=True)
+    image_srcset = ImageSrcsetField(storage=Recipe._meta.get_field('image').storage, source='image_variants')
 
     class Meta:
+        list_serializer_class = RecipeListSerializer
         model = Recipe
-        fields = ('id', 'image', 'name', 'description', 'cooking_description', 'category', 'category_id', 'ingredients',
-                  'bookmarks_count', 'views')
+        fields = ('id', 'image', 'image_srcset', 'name', 'slug', 'description', 'cooking_description', 'category',
+                  'category_id', 'ingredients', 'bookmarks_count', 'comments_count', 'views')
+        read_only_fields = ('slug', 'bookmarks_count', 'comments_count', 'views')
+
+
+class RecipeSummarySerializer(RecipeSerializer):
+    """Slim representation of recipes in lists, without the cooking description and relations."""
+
+    class Meta(RecipeSerializer.Meta):
+        fields = (
+            'id', 'image', 'image_srcset', 'name', 'slug', 'description', 'bookmarks_count', 'comments_count', 'views',
+        )
 
 
 class RecipeBookmarkSerializer(serializers.ModelSerializer):
     recipe_id = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all(), source='recipe')
+    recipe = RecipeSummarySerializer(read_only=True)
 
     class Meta:
         model = RecipeBookmark
-        fields = ('id', 'recipe_id', 'user')
+        fields = ('id', 'recipe_id', 'recipe', 'user')
+
+
+class RecipeBookmarksSyncSerializer(serializers.Serializer):
+    max_recipes = 500
+
+    add = serializers.ListField(child=serializers.IntegerField(min_value=1), max_length=max_recipes, default=list)
+    remove = serializers.ListField(child=serializers.IntegerField(min_value=1), max_length=max_recipes, default=list)
+
+    def validate(self, attrs):
+        conflicting_ids = set(attrs['add']) & set(attrs['remove'])
+        if conflicting_ids:
+            raise ValidationError({
+                'remove': f'Recipes cannot be both added and removed: {", ".join(map(str, sorted(conflicting_ids)))}.',
+            })
+        return attrs
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -1,10 +1,24 @@
 from django.contrib.staticfiles.finders import find
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
+from django_redis import get_redis_connection
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from api.recipe.views import IngredientGenericViewSet
+from common.cache import get_tag_versions
 from common.tests import DisableLoggingMixin, TestUser
+from interactions.models import RecipeBookmark, RecipeComment
+from recipe.feed import recipe_feed
+from recipe.ingredient_index import ingredient_index, normalize_ingredient
 from recipe.models import Category, Ingredient, Recipe
+from recipe.related import build_related_recipes
+from recipe.suggest import suggestion_index
+from recipe.trending import (BOOKMARK_WEIGHT, TRENDING_EPOCH_KEY,
+                             TRENDING_SCORES_KEY)
 
 test_user = TestUser()
 
@@ -108,6 +122,15 @@ class RecipeTestCase(DisableLoggingMixin, APITestCase):
             Ingredient.objects.filter(recipe_id=self.object.id).count()
         )
 
+    def test_recipe_unique_viewers(self):
+        path = reverse('api:recipe:recipes-unique-viewers', kwargs={'pk': self.object.id})
+
+        response = self.client.get(path, {'days': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('days'), 1)
+        self.assertIn('unique_viewers', response.data)
+
     def test_recipe_list(self):
         response = self.client.get(self.list_path)
 
@@ -209,3 +232,659 @@ class IngredientTestCase(DisableLoggingMixin, APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Ingredient.objects.filter(id=self.object.id).exists())
+
+
+class RecipeSuggestTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        suggestion_index.refresh()
+        self.path = reverse('api:recipe:recipes-suggest')
+        self.recipe = Recipe.objects.first()
+
+    def test_suggest_prefix(self):
+        response = self.client.get(self.path, {'search': self.recipe.name[:3]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(self.recipe.slug, [suggestion.get('slug') for suggestion in response.data])
+
+    def test_suggest_typo(self):
+        Ingredient.objects.create(name='Mozzarella', recipe=self.recipe)
+
+        response = self.client.get(self.path, {'search': 'mozarela'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0], {'text': 'Mozzarella', 'type': 'ingredient'})
+
+    def test_suggest_keeps_digits(self):
+        Ingredient.objects.create(name='00 flour', recipe=self.recipe)
+
+        response = self.client.get(self.path, {'search': '00'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0], {'text': '00 flour', 'type': 'ingredient'})
+
+    def test_suggest_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.path, {'search': self.recipe.name})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_suggest_invalid_limit(self):
+        response = self.client.get(self.path, {'search': 'a', 'limit': 'abc'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeByIngredientsTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.path = reverse('api:recipe:recipes-by-ingredients')
+        self.full_match, self.partial_match = Recipe.objects.all()[:2]
+        for name in ('200 g of Tomatoes', 'Basil', 'Mozzarella'):
+            Ingredient.objects.create(name=name, recipe=self.full_match)
+        for name in ('Cherry tomatoes', 'Salt'):
+            Ingredient.objects.create(name=name, recipe=self.partial_match)
+        ingredient_index.refresh()
+
+    def test_by_ingredients_ranking(self):
+        response = self.client.get(self.path, {'ingredients': 'tomato,basil'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data.get('results')
+        self.assertEqual([recipe['id'] for recipe in results], [self.full_match.id, self.partial_match.id])
+        self.assertEqual(results[0]['matched_ingredients'], 2)
+        self.assertEqual(results[0]['missing_ingredients'], 1)
+
+    def test_by_ingredients_match_all(self):
+        response = self.client.get(self.path, {'ingredients': ['tomato', 'basil'], 'match': 'all'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([recipe['id'] for recipe in response.data.get('results')], [self.full_match.id])
+
+    def test_by_ingredients_drops_only_quantities(self):
+        Ingredient.objects.create(name='7up', recipe=self.partial_match)
+        ingredient_index.refresh()
+
+        response = self.client.get(self.path, {'ingredients': '7up'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([recipe['id'] for recipe in response.data.get('results')], [self.partial_match.id])
+        self.assertEqual(normalize_ingredient('200g Tomatoes'), 'tomato')
+        self.assertEqual(normalize_ingredient('1 cup of 7up'), '7up')
+
+    def test_by_ingredients_required(self):
+        response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CursorPaginationTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.user = test_user.create_user()
+        self.recipe = Recipe.objects.first()
+        for number in range(5):
+            RecipeComment.objects.create(recipe=self.recipe, author=self.user, text=f'Comment {number}')
+        self.comments_path = reverse('api:recipe:comments-list')
+        self.recipes_path = reverse('api:recipe:recipes-list')
+
+    def _collect_pages(self, url, link='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data[link]
+        return ids
+
+    def test_comments_cursor_pagination(self):
+        url = f'{self.comments_path}?recipe_id={self.recipe.id}&pagination=cursor&page_size=2'
+
+        ids = self._collect_pages(url)
+
+        comments = RecipeComment.objects.filter(recipe=self.recipe).order_by('-created_date', 'id')
+        self.assertEqual(ids, list(comments.values_list('id', flat=True)))
+
+    def test_comments_cursor_pagination_without_count(self):
+        with CaptureQueriesContext(connection) as context:
+            ids = self._collect_pages(f'{self.comments_path}?recipe_id={self.recipe.id}&pagination=cursor&page_size=2')
+
+        self.assertEqual(len(ids), 5)
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+
+    def test_comments_page_pagination_by_default(self):
+        first_page = self.client.get(self.comments_path, {'recipe_id': self.recipe.id, 'page_size': 2})
+        second_page = self.client.get(self.comments_path, {'recipe_id': self.recipe.id, 'page_size': 2, 'page': 2})
+
+        self.assertEqual(first_page.data['count'], 5)
+        self.assertIn('page=2', first_page.data['next'])
+        first_ids = {comment['id'] for comment in first_page.data['results']}
+        second_ids = {comment['id'] for comment in second_page.data['results']}
+        self.assertEqual(len(second_ids), 2)
+        self.assertFalse(first_ids & second_ids)
+
+    def test_recipes_cursor_pagination(self):
+        ids = self._collect_pages(f'{self.recipes_path}?pagination=cursor&page_size=2')
+
+        self.assertEqual(ids, list(Recipe.objects.order_by('name', 'id').values_list('id', flat=True)))
+
+    def test_recipes_cursor_previous_page(self):
+        first_page = self.client.get(f'{self.recipes_path}?pagination=cursor&page_size=1')
+        second_page = self.client.get(first_page.data['next'])
+
+        previous_page = self.client.get(second_page.data['previous'])
+
+        self.assertEqual(previous_page.data['results'], first_page.data['results'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'{self.recipes_path}?cursor=invalid')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        self.recipe = Recipe.objects.first()
+        self.detail_path = reverse('api:recipe:recipes-detail', kwargs={'pk': self.recipe.id})
+        self.list_path = reverse('api:recipe:recipes-list')
+        self.categories_path = reverse('api:recipe:categories-list')
+
+    def _assert_not_modified(self, path):
+        response = self.client.get(path)
+        self.assertIn('ETag', response)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        return response
+
+    def test_recipe_retrieve_not_modified(self):
+        response = self.client.get(self.detail_path)
+
+        not_modified = self.client.get(self.detail_path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_recipe_retrieve_ignores_if_modified_since(self):
+        self.client.get(self.detail_path)
+        self.recipe.bookmarks.add(test_user.create_user(), through_defaults=None)
+
+        response = self.client.get(self.detail_path, HTTP_IF_MODIFIED_SINCE=http_date())
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bookmarks_count'], 1)
+
+    def test_recipe_retrieve_modified_by_ingredient(self):
+        response = self.client.get(self.detail_path)
+
+        Ingredient.objects.create(name='Saffron', recipe=self.recipe)
+        modified = self.client.get(self.detail_path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(modified['ETag'], response['ETag'])
+
+    def test_recipe_retrieve_modified_by_category(self):
+        response = self.client.get(self.detail_path)
+
+        category = self.recipe.category
+        category.name = 'Renamed'
+        category.save()
+        modified = self.client.get(self.detail_path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, status.HTTP_200_OK)
+        self.assertEqual(modified.data['category']['name'], 'Renamed')
+
+    def test_recipe_list_not_modified(self):
+        self._assert_not_modified(self.list_path)
+
+    def test_recipe_list_modified_by_bookmark(self):
+        response = self._assert_not_modified(self.list_path)
+
+        self.recipe.bookmarks.add(test_user.create_user(), through_defaults=None)
+        modified = self.client.get(self.list_path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, status.HTTP_200_OK)
+
+    def test_recipe_modified_by_comment(self):
+        list_response = self._assert_not_modified(self.list_path)
+        detail_response = self.client.get(self.detail_path)
+
+        RecipeComment.objects.create(recipe=self.recipe, author=test_user.create_user(), text='Comment')
+
+        for path, response in ((self.list_path, list_response), (self.detail_path, detail_response)):
+            modified = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(modified.status_code, status.HTTP_200_OK)
+
+    def test_category_list_not_modified(self):
+        response = self._assert_not_modified(self.categories_path)
+
+        Category.objects.create(name='Test', slug='test')
+        modified = self.client.get(self.categories_path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, status.HTTP_200_OK)
+        self.assertEqual(modified.data['count'], response.data['count'] + 1)
+
+
+class RecipeTrendingTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        self.path = reverse('api:recipe:recipes-trending')
+        self.recipe = Recipe.objects.first()
+        get_redis_connection('default').delete(TRENDING_SCORES_KEY, TRENDING_EPOCH_KEY)
+
+    def tearDown(self):
+        get_redis_connection('default').delete(TRENDING_SCORES_KEY, TRENDING_EPOCH_KEY)
+
+    def test_trending(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.bookmarks.add(test_user.create_user(), through_defaults=None)
+
+        response = self.client.get(self.path, {'limit': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([recipe['id'] for recipe in response.data], [self.recipe.id])
+        self.assertAlmostEqual(response.data[0]['trending_score'], BOOKMARK_WEIGHT, places=3)
+
+
+class RelatedRecipesTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.recipe, self.related_recipe = Recipe.objects.order_by('id')[:2]
+        user = test_user.create_user()
+        self.recipe.bookmarks.add(user, through_defaults=None)
+        self.related_recipe.bookmarks.add(user, through_defaults=None)
+        build_related_recipes()
+
+    def test_related(self):
+        response = self.client.get(reverse('api:recipe:recipes-related', kwargs={'pk': self.recipe.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([recipe['id'] for recipe in response.data], [self.related_recipe.id])
+        self.assertAlmostEqual(response.data[0]['similarity'], 1, places=5)
+
+
+class RecipeFeedTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        self.user = test_user.create_user()
+        self.path = reverse('api:recipe:recipes-feed')
+        recipe_feed.refresh()
+
+    def tearDown(self):
+        cache.delete_pattern('recipe_feed:*')
+
+    def test_feed(self):
+        Recipe.objects.first().bookmarks.add(self.user, through_defaults=None)
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['results'])
+        self.assertNotIn(Recipe.objects.first().id, [recipe['id'] for recipe in response.data['results']])
+        self.assertIsNotNone(response.data['results'][0]['feed_score'])
+
+    def test_feed_unauthorized(self):
+        response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RecipeQueryCountTestCase(APITestCase):
+    """The number of queries of every recipes API action must not depend on the number of returned recipes."""
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        self.user = test_user.create_user()
+        self.recipes = list(Recipe.objects.order_by('id'))
+        for recipe in self.recipes:
+            Ingredient.objects.create(name='Salt', recipe=recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            for recipe in self.recipes:
+                recipe.bookmarks.add(self.user, through_defaults=None)
+        self.client.force_authenticate(self.user)
+        build_related_recipes()
+        ingredient_index.refresh()
+        recipe_feed.refresh()
+
+    def tearDown(self):
+        redis = get_redis_connection('default')
+        redis.delete(TRENDING_SCORES_KEY, TRENDING_EPOCH_KEY)
+        cache.delete_pattern('recipe_feed:*')
+
+    def _count_queries(self, path, **params):
+        self.client.get(path, params)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def _assert_queries(self, path, expected, **params):
+        self.assertEqual(self._count_queries(path, page_size=1, limit=1, **params), expected)
+        self.assertEqual(self._count_queries(path, page_size=10, limit=10, **params), expected)
+
+    def test_list(self):
+        # Live counters of the page, recipes come from the snapshot.
+        self._assert_queries(reverse('api:recipe:recipes-list'), 1)
+
+    def test_list_cursor(self):
+        self._assert_queries(reverse('api:recipe:recipes-list'), 1, pagination='cursor')
+
+    def test_list_search(self):
+        # The count and the page, matches are ranked within the same query.
+        self._assert_queries(reverse('api:recipe:recipes-list'), 2, search='pizza')
+
+    def test_list_with_ingredients(self):
+        self._assert_queries(reverse('api:recipe:recipes-list'), 2, fields='id,category,ingredients')
+
+    def test_list_with_cooking_description(self):
+        # The count and the page, the snapshot does not keep the cooking description.
+        self._assert_queries(reverse('api:recipe:recipes-list'), 2, fields='id,cooking_description')
+
+    def test_list_cursor_with_ingredients(self):
+        path = reverse('api:recipe:recipes-list')
+
+        self._assert_queries(path, 2, pagination='cursor', fields='id,category,ingredients')
+
+    def test_retrieve(self):
+        path = reverse('api:recipe:recipes-detail', kwargs={'pk': self.recipes[0].id})
+
+        self.assertEqual(self._count_queries(path), 2)
+
+    def test_by_ingredients(self):
+        self._assert_queries(reverse('api:recipe:recipes-by-ingredients'), 1, ingredients='salt')
+
+    def test_trending(self):
+        self._assert_queries(reverse('api:recipe:recipes-trending'), 1)
+
+    def test_related(self):
+        path = reverse('api:recipe:recipes-related', kwargs={'pk': self.recipes[0].id})
+
+        # The recipe, its related ids, then live counters of the related recipes.
+        self._assert_queries(path, 3)
+
+    def test_feed(self):
+        self._assert_queries(reverse('api:recipe:recipes-feed'), 1)
+
+
+class RecipeSparseFieldsetTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        self.recipe = Recipe.objects.order_by('name').first()
+        self.list_path = reverse('api:recipe:recipes-list')
+        self.detail_path = reverse('api:recipe:recipes-detail', kwargs={'pk': self.recipe.id})
+
+    def test_list_is_slim_by_default(self):
+        response = self.client.get(self.list_path)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {
+                'id', 'image', 'image_srcset', 'name', 'slug', 'description', 'bookmarks_count', 'comments_count',
+                'views',
+            },
+        )
+
+    def test_retrieve_is_full_by_default(self):
+        response = self.client.get(self.detail_path)
+
+        self.assertIn('cooking_description', response.data)
+        self.assertIn('ingredients', response.data)
+        self.assertEqual(response.data['category']['id'], self.recipe.category_id)
+
+    def test_fields(self):
+        response = self.client.get(self.list_path, {'fields': 'id,cooking_description,ingredients'})
+
+        self.assertEqual(set(response.data['results'][0]), {'id', 'cooking_description', 'ingredients'})
+        self.assertEqual(response.data['results'][0]['cooking_description'], self.recipe.cooking_description)
+
+    def test_omit(self):
+        response = self.client.get(self.detail_path, {'omit': 'cooking_description,ingredients'})
+
+        self.assertNotIn('cooking_description', response.data)
+        self.assertNotIn('ingredients', response.data)
+        self.assertEqual(response.data['name'], self.recipe.name)
+
+    def test_unknown_fields(self):
+        response = self.client.get(self.list_path, {'fields': 'id,secret'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+    def test_deferred_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.list_path, {'pagination': 'cursor', 'fields': 'id,name'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('cooking_description', ' '.join(query['sql'] for query in context.captured_queries))
+
+    def test_etag_depends_on_fields(self):
+        response = self.client.get(self.detail_path)
+        sparse_response = self.client.get(self.detail_path, {'fields': 'id'})
+
+        self.assertNotEqual(response['ETag'], sparse_response['ETag'])
+
+
+class BulkWriteTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        self.user = test_user.create_user(is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.order_by('id').first()
+        self.ingredients_path = reverse('api:recipe:ingredients-bulk')
+        self.recipes_path = reverse('api:recipe:recipes-bulk')
+
+    def test_ingredients_created(self):
+        initial_count = Ingredient.objects.count()
+        tag_versions = get_tag_versions(Ingredient)
+        data = [{'name': f'Spice {number}', 'recipe_id': self.recipe.id} for number in range(20)]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.ingredients_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 20)
+        self.assertTrue(all(item['id'] for item in response.data))
+        self.assertEqual(Ingredient.objects.count(), initial_count + 20)
+        self.assertNotEqual(get_tag_versions(Ingredient), tag_versions)
+        self.assertGreater(Recipe.objects.get(id=self.recipe.id).updated_at, self.recipe.updated_at)
+
+    def test_invalid_item_fails_whole_request(self):
+        initial_count = Ingredient.objects.count()
+        data = [{'name': 'Salt', 'recipe_id': self.recipe.id}, {'name': 'Pepper'}]
+
+        response = self.client.post(self.ingredients_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('recipe_id', response.data[1])
+        self.assertEqual(Ingredient.objects.count(), initial_count)
+
+    def test_too_many_items(self):
+        data = [{'name': 'Salt', 'recipe_id': self.recipe.id}] * (IngredientGenericViewSet.bulk_max_items + 1)
+
+        response = self.client.post(self.ingredients_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ingredients_updated(self):
+        ingredients = list(Ingredient.objects.order_by('id')[:2])
+        data = [{'id': ingredient.id, 'name': f'Updated {ingredient.id}'} for ingredient in ingredients]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.ingredients_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for ingredient in ingredients:
+            ingredient.refresh_from_db()
+            self.assertEqual(ingredient.name, f'Updated {ingredient.id}')
+
+    def test_update_errors_listed_per_item(self):
+        ingredient = Ingredient.objects.first()
+        data = [{'id': ingredient.id, 'name': 'Salt'}, {'name': 'Pepper'}, {'id': 0}, {'id': ingredient.id}]
+
+        response = self.client.patch(self.ingredients_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual([set(errors) for errors in response.data[1:]], [{'id'}, {'id'}, {'id'}])
+        self.assertNotEqual(Ingredient.objects.get(id=ingredient.id).name, 'Salt')
+
+    def test_recipes_updated_and_reindexed(self):
+        recipes = list(Recipe.objects.order_by('id')[:2])
+        data = [{'id': recipe.id, 'name': f'Bulkupdated {recipe.id}'} for recipe in recipes]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.recipes_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], [item['name'] for item in data])
+        for recipe in recipes:
+            updated_recipe = Recipe.objects.get(id=recipe.id)
+            self.assertEqual(updated_recipe.name, f'Bulkupdated {recipe.id}')
+            self.assertGreater(updated_recipe.updated_at, recipe.updated_at)
+            self.assertEqual(updated_recipe.views, recipe.views)
+        self.assertEqual(
+            set(Recipe.objects.search('Bulkupdated').values_list('id', flat=True)),
+            {recipe.id for recipe in recipes},
+        )
+
+    def test_recipes_not_created(self):
+        initial_count = Recipe.objects.count()
+        data = [{'name': 'Bulkcreated', 'description': 'Test', 'category_id': self.recipe.category_id}]
+
+        response = self.client.post(self.recipes_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(Recipe.objects.count(), initial_count)
+
+    def test_recipe_image_not_updated(self):
+        data = [{'id': self.recipe.id, 'image': 'recipe_images/other.jpg'}]
+
+        response = self.client.patch(self.recipes_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data[0])
+        self.assertEqual(Recipe.objects.get(id=self.recipe.id).image, self.recipe.image)
+
+    def test_forbidden_for_non_staff(self):
+        self.client.force_authenticate(test_user.create_user(username='regular', email='regular@example.com'))
+
+        data = [{'name': 'Salt', 'recipe_id': self.recipe.id}]
+
+        response = self.client.post(self.ingredients_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RecipeBookmarkSyncTestCase(APITestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.user = test_user.create_user()
+        self.client.force_authenticate(self.user)
+        self.recipes = list(Recipe.objects.order_by('id')[:3])
+        self.list_path = reverse('api:recipe:bookmarks-list')
+        self.sync_path = reverse('api:recipe:bookmarks-sync')
+
+    def test_sync(self):
+        self.recipes[0].bookmarks.add(self.user, through_defaults=None)
+        data = {'add': [self.recipes[1].id, self.recipes[2].id, self.recipes[1].id], 'remove': [self.recipes[0].id]}
+
+        # One INSERT, one DELETE and a counters UPDATE per direction in a savepoint, then the resulting ids.
+        with self.assertNumQueries(7):
+            response = self.client.post(self.sync_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['added'], [self.recipes[1].id, self.recipes[2].id])
+        self.assertEqual(response.data['removed'], [self.recipes[0].id])
+        self.assertEqual(response.data['recipe_ids'], [self.recipes[1].id, self.recipes[2].id])
+
+    def test_sync_replayed(self):
+        data = {'add': [self.recipes[0].id]}
+        self.client.post(self.sync_path, data, format='json')
+
+        response = self.client.post(self.sync_path, data, format='json')
+
+        self.assertEqual(response.data['added'], [])
+        self.assertEqual(response.data['recipe_ids'], [self.recipes[0].id])
+        self.assertEqual(Recipe.objects.get(id=self.recipes[0].id).bookmarks_count, 1)
+
+    def test_sync_conflicting_ids(self):
+        data = {'add': [self.recipes[0].id], 'remove': [self.recipes[0].id]}
+
+        response = self.client.post(self.sync_path, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('remove', response.data)
+
+    def test_create_twice(self):
+        for _ in range(2):
+            response = self.client.post(self.list_path, {'recipe_id': self.recipes[0].id}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(RecipeBookmark.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(response.data['recipe_id'], self.recipes[0].id)
+
+    def test_destroy(self):
+        self.recipes[0].bookmarks.add(self.user, through_defaults=None)
+        detail_path = reverse('api:recipe:bookmarks-detail', kwargs={'pk': self.recipes[0].id})
+
+        self.assertEqual(self.client.delete(detail_path).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(detail_path).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(RecipeBookmark.objects.filter(user=self.user).exists())
+
+    def test_list_paginated_by_page(self):
+        for recipe in self.recipes:
+            recipe.bookmarks.add(self.user, through_defaults=None)
+
+        first_page = self.client.get(self.list_path, {'page_size': 2})
+        second_page = self.client.get(self.list_path, {'page_size': 2, 'page': 2})
+
+        self.assertEqual(first_page.data['count'], 3)
+        self.assertEqual(len(second_page.data['results']), 1)
+        self.assertNotIn(
+            second_page.data['results'][0]['id'],
+            {bookmark['id'] for bookmark in first_page.data['results']},
+        )
+
+    def test_list_paginated_by_cursor(self):
+        for recipe in self.recipes:
+            recipe.bookmarks.add(self.user, through_defaults=None)
+
+        response = self.client.get(self.list_path, {'page_size': 2, 'pagination': 'cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIn('cursor=', response.data['next'])
+        self.assertEqual(
+            set(response.data['results'][0]['recipe']),
+            {
+                'id', 'image', 'image_srcset', 'name', 'slug', 'description', 'bookmarks_count', 'comments_count',
+                'views',
+            },
+        )
+
+        response = self.client.get(response.data['next'])
+
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_destroy_unknown_recipe(self):
+        detail_path = reverse('api:recipe:bookmarks-detail', kwargs={'pk': 0})
+
+        self.assertEqual(self.client.delete(detail_path).status_code, status.HTTP_404_NOT_FOUND)
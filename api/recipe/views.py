@@ -1,31 +1,53 @@
 
-from django.db.models import Q
+from django.db.models import QuerySet
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
                                    ListModelMixin, UpdateModelMixin)
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from api.recipe.pagination import (CategoryPageNumberPagination,
+from api.recipe.mixins import (BulkCreateUpdateMixin, ConditionalListMixin,
+                               ConditionalRetrieveMixin, SparseFieldsetMixin)
+from api.recipe.pagination import (BookmarkPageNumberPagination,
+                                   CategoryPageNumberPagination,
                                    CommentPageNumberPagination,
                                    RecipePageNumberPagination)
 from api.recipe.serializers import (CategorySerializer, CommentSerializer,
                                     IngredientSerializer,
-                                    RecipeBookmarkSerializer, RecipeSerializer)
-from interactions.models import RecipeBookmark
+                                    RecipeBookmarkSerializer,
+                                    RecipeBookmarksSyncSerializer,
+                                    RecipeSerializer, RecipeSummarySerializer)
+from common.cache import get_tag_versions
+from common.conditional import make_etag
+from common.snapshots import Snapshot
+from interactions.models import RecipeBookmark, RecipeComment
+from recipe.counters import (UNIQUE_VIEWERS_RETENTION_DAYS, VIEWS_CACHE_TAG,
+                             apply_pending_views, get_unique_viewers)
+from recipe.feed import recipe_feed
+from recipe.images import IMAGE_VARIANTS_CACHE_TAG
+from recipe.ingredient_index import ingredient_index
 from recipe.models import Category, Ingredient, Recipe
+from recipe.related import RELATED_RECIPES_COUNT
+from recipe.suggest import suggestion_index
 
 
-class CategoryModelViewSet(ModelViewSet):
+class CategoryModelViewSet(ConditionalListMixin, ConditionalRetrieveMixin, ModelViewSet):
     model = Category
     serializer_class = CategorySerializer
     pagination_class = CategoryPageNumberPagination
+    list_cache_tags = (Category,)
 
     def get_queryset(self):
-        queryset = self.model.objects.cached_queryset()
+        if self.action == 'list':
+            queryset = self.model.objects.cached_snapshot()
+        else:
+            queryset = self.model.objects.all()
         return queryset.order_by('name')
 
     def get_permissions(self):
@@ -34,37 +56,176 @@ class CategoryModelViewSet(ModelViewSet):
         return super().get_permissions()
 
 
-class RecipeModelViewSet(ModelViewSet):
+class RecipeModelViewSet(
+    BulkCreateUpdateMixin, SparseFieldsetMixin, ConditionalListMixin, ConditionalRetrieveMixin, ModelViewSet,
+):
     model = Recipe
     serializer_class = RecipeSerializer
+    summary_serializer_class = RecipeSummarySerializer
+    summary_actions = ('list', 'trending', 'feed', 'related', 'by_ingredients')
+    # Read by the keyset cursor, the ETag of a recipe and the pending views.
+    loaded_fields = ('id', 'name', 'updated_at', 'views', 'bookmarks_count', 'comments_count')
     pagination_class = RecipePageNumberPagination
+    # New recipes need an image file and a unique slug, which JSON items can not provide.
+    bulk_methods = ('patch',)
     ordering = ('name',)
+    list_cache_tags = (
+        Recipe, Category, Ingredient, RecipeBookmark, RecipeComment, VIEWS_CACHE_TAG, IMAGE_VARIANTS_CACHE_TAG,
+    )
+    suggestions_limit = 10
+    max_suggestions_limit = 20
+    trending_limit = 10
+    max_trending_limit = 50
 
     def get_queryset(self):
-        queryset = self.model.objects.cached_queryset()
-
         selected_category_slug = self.request.query_params.get('category_slug')
         search = self.request.query_params.get('search')
 
         if search:
-            queryset = queryset.filter(Q(name__icontains=search) | Q(description__icontains=search))
-        elif selected_category_slug:
+            return self.select_serialized_fields(self.model.objects.search(search))
+
+        if self.action == 'list' and not self.paginator.is_keyset_requested(self.request) and self.is_snapshot_enough():
+            queryset = self.model.objects.cached_snapshot()
+        else:
+            queryset = self.select_serialized_fields(self.model.objects.all())
+        if selected_category_slug:
             queryset = queryset.filter(category__slug=selected_category_slug)
 
         return queryset.order_by(*self.ordering)
 
+    def is_snapshot_enough(self) -> bool:
+        """Whether the snapshot has every column the serializer reads, e.g. not the cooking description."""
+        columns, _ = self.get_serialized_fields(self.model)
+        snapshot_columns = {
+            *self.model.objects.snapshot_fields, *self.model.objects.live_snapshot_fields, *self.model.counter_fields,
+            'category',
+        }
+        return columns <= snapshot_columns
+
+    def get_object(self):
+        recipe = super().get_object()
+        apply_pending_views([recipe])
+        return recipe
+
+    def get_object_etag(self, instance):
+        # The nested category changes without touching the recipe, its version keeps it out of the database query.
+        return make_etag(
+            instance.pk,
+            instance.updated_at,
+            get_tag_versions(Category),
+            instance.views,
+            instance.bookmarks_count,
+            instance.comments_count,
+            self.get_fieldset(),
+            self.request.accepted_media_type,
+        )
+
+    def get_object_last_modified(self, instance):
+        # Counters and the nested category change without bumping updated_at.
+        return None
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and isinstance(queryset, (QuerySet, Snapshot)):
+            apply_pending_views(page)
+        return page
+
+    def _get_limit(self, default, maximum):
+        try:
+            limit = int(self.request.query_params.get('limit', default))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        return min(max(limit, 1), maximum)
+
+    @action(detail=False, methods=('get',), authentication_classes=(), permission_classes=(AllowAny,))
+    def suggest(self, request, *args, **kwargs):
+        search = request.query_params.get('search', '')
+        limit = self._get_limit(self.suggestions_limit, self.max_suggestions_limit)
+        return Response(suggestion_index.suggest(search, limit))
+
+    @action(detail=False, methods=('get',))
+    def trending(self, request, *args, **kwargs):
+        limit = self._get_limit(self.trending_limit, self.max_trending_limit)
+        recipes = apply_pending_views(self.model.objects.trending_recipes(limit))
+
+        data = self.get_serializer(recipes, many=True).data
+        for recipe, recipe_data in zip(recipes, data):
+            recipe_data['trending_score'] = recipe.trending_score
+        return Response(data)
+
+    @action(detail=True, methods=('get',), url_path='unique-viewers')
+    def unique_viewers(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        try:
+            days = int(request.query_params.get('days', 7))
+        except ValueError:
+            return Response({'days': 'A valid integer is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        days = min(max(days, 1), UNIQUE_VIEWERS_RETENTION_DAYS)
+        return Response({'recipe_id': recipe.id, 'days': days, 'unique_viewers': get_unique_viewers(recipe.id, days)})
+
+    @action(detail=False, methods=('get',), permission_classes=(IsAuthenticated,))
+    def feed(self, request, *args, **kwargs):
+        feed = recipe_feed.get_feed(request.user.id)
+        if not feed:
+            popular_recipe_ids = self.model.objects.popular_recipe_ids(self.model.objects.popular_recipes_limit)
+            feed = [(recipe_id, None) for recipe_id in popular_recipe_ids]
+
+        paginated_feed = self.paginate_queryset(feed)
+        recipes = self.model.objects.cached_snapshot().in_bulk([recipe_id for recipe_id, _ in paginated_feed])
+        recipes = apply_pending_views(recipes.get(recipe_id) for recipe_id, _ in paginated_feed)
+
+        data = self.get_serializer(recipes, many=True).data
+        scores = dict(paginated_feed)
+        for recipe, recipe_data in zip(recipes, data):
+            recipe_data['feed_score'] = scores[recipe.id]
+        return self.get_paginated_response(data)
+
+    @action(detail=True, methods=('get',))
+    def related(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        limit = self._get_limit(RELATED_RECIPES_COUNT, RELATED_RECIPES_COUNT)
+        recipes = apply_pending_views(self.model.objects.related_recipes(recipe.id, limit))
+
+        data = self.get_serializer(recipes, many=True).data
+        for related_recipe, recipe_data in zip(recipes, data):
+            recipe_data['similarity'] = related_recipe.similarity
+        return Response(data)
+
+    @action(detail=False, methods=('get',), url_path='by-ingredients')
+    def by_ingredients(self, request, *args, **kwargs):
+        ingredients = [
+            ingredient
+            for value in request.query_params.getlist('ingredients')
+            for ingredient in value.split(',')
+        ]
+        if not ingredients:
+            return Response({'ingredients': 'This field is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = ingredient_index.match(ingredients, require_all=request.query_params.get('match') == 'all')
+        paginated_matches = self.paginate_queryset(matches)
+        recipes = self.model.objects.cached_snapshot().in_bulk([match.recipe_id for match in paginated_matches])
+        paginated_matches = [match for match in paginated_matches if match.recipe_id in recipes]
+        recipes = apply_pending_views(recipes[match.recipe_id] for match in paginated_matches)
+
+        data = self.get_serializer(recipes, many=True).data
+        for match, recipe_data in zip(paginated_matches, data):
+            recipe_data.update(matched_ingredients=match.matched, missing_ingredients=match.missing)
+        return self.get_paginated_response(data)
+
     def get_permissions(self):
-        if self.action in ('create', 'update', 'destroy'):
+        if self.action in ('create', 'update', 'destroy', 'bulk'):
             self.permission_classes = (IsAdminUser,)
         return super().get_permissions()
 
 
-class IngredientGenericViewSet(CreateModelMixin, UpdateModelMixin, GenericViewSet, DestroyModelMixin):
+class IngredientGenericViewSet(
+    BulkCreateUpdateMixin, CreateModelMixin, UpdateModelMixin, GenericViewSet, DestroyModelMixin,
+):
     queryset = Ingredient.objects.order_by('name')
     serializer_class = IngredientSerializer
 
     def get_permissions(self):
-        if self.action in ('create', 'update', 'destroy'):
+        if self.action in ('create', 'update', 'destroy', 'bulk'):
             self.permission_classes = (IsAdminUser,)
         return super().get_permissions()
 
@@ -78,7 +239,7 @@ class CommentGenericViewSet(GenericViewSet, ListModelMixin, CreateModelMixin):
         recipe_id = request.GET.get('recipe_id')
         if not recipe_id:
             return Response({'recipe_id': 'This field is required.'}, status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=recipe_id)
+        recipe = get_object_or_404(Recipe.objects.only('id'), id=recipe_id)
         comments = recipe.comments().order_by('-created_date')
         paginated_comments = self.paginate_queryset(comments)
         serializer = self.serializer_class(paginated_comments, many=True)
@@ -101,12 +262,13 @@ class RecipeBookmarkGenericViewSet(GenericViewSet, ListModelMixin, CreateModelMi
     authentication_classes = (SessionAuthentication,)
     serializer_class = RecipeBookmarkSerializer
     permission_classes = (IsAuthenticated,)
-    pagination_class = RecipePageNumberPagination
+    pagination_class = BookmarkPageNumberPagination
     ordering = ('-created_date',)
 
     def list(self, request, *args, **kwargs):
         bookmarks = RecipeBookmark.objects.user_bookmarks(request.user).order_by(*self.ordering)
         paginated_bookmarks = self.paginate_queryset(bookmarks)
+        apply_pending_views(bookmark.recipe for bookmark in paginated_bookmarks)
         serializer = self.serializer_class(paginated_bookmarks, many=True)
         return self.get_paginated_response(serializer.data)
 
@@ -114,14 +276,31 @@ class RecipeBookmarkGenericViewSet(GenericViewSet, ListModelMixin, CreateModelMi
         recipe_id = request.data.get('recipe_id')
         if not recipe_id:
             return Response({'recipe_id': 'This field is required.'}, status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        recipe.bookmarks.add(request.user, through_defaults=None)
-        bookmark = self.model.objects.get(recipe=recipe, user=request.user)
+        if not str(recipe_id).isdigit():
+            return Response({'recipe_id': 'A valid integer is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        recipe_id = int(recipe_id)
+        self.model.objects.sync(request.user.id, add=[recipe_id])
+        bookmark = get_object_or_404(self.model.objects.user_bookmarks(request.user.id), recipe_id=recipe_id)
         serializer = self.serializer_class(bookmark)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
         recipe_id = kwargs.get('pk')
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        recipe.bookmarks.remove(request.user)
+        if not recipe_id.isdigit():
+            raise Http404
+        recipe_id = int(recipe_id)
+        _, removed = self.model.objects.sync(request.user.id, remove=[recipe_id])
+        if not removed:
+            get_object_or_404(Recipe, id=recipe_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=('post',))
+    def sync(self, request, *args, **kwargs):
+        serializer = RecipeBookmarksSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        added, removed = self.model.objects.sync(request.user.id, **serializer.validated_data)
+        return Response({
+            'added': added,
+            'removed': removed,
+            'recipe_ids': sorted(self.model.objects.user_recipe_ids(request.user.id)),
+        })
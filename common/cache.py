@@ -1,14 +1,269 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+from uuid import uuid4
+
 from django.core.cache import cache
+from django_redis import get_redis_connection
+
+TAG_VERSION_KEY = 'cache_tag_version:{tag}'
+LOCK_KEY = 'cache_lock:{key}'
+
+STALE_TIMEOUT = 60 * 10
+LOCK_TIMEOUT = 30
+LOCK_WAIT_INTERVAL = 0.05
+# Tag versions are read by each process at most this often for its local entries, so invalidations
+# made by other processes are seen locally within this many seconds.
+LOCAL_VERSIONS_TIMEOUT = 1
+
+# Deletes the lock only if it is still held by the caller, it may have expired and been taken by another worker.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """
+    Wraps cached data, so falsy data can be cached as well, and keeps
+    what is needed to refresh it in time: the versions of its tags,
+    the moment it expires and how long it took to compute.
+    """
+    versions: tuple
+    data: Any
+    expires_at: float
+    compute_time: float
+
+    def is_fresh(self, versions) -> bool:
+        return self.versions == versions and time.time() < self.expires_at
+
+    def should_refresh_early(self, beta: float) -> bool:
+        """
+        Probabilistic early expiration (XFetch): the closer the expiry
+        and the longer the computation, the more likely a reader is to
+        refresh the entry ahead of time, so that readers do not miss
+        all at once when it expires.
+        """
+        return time.time() - self.compute_time * beta * math.log(1 - random.random()) >= self.expires_at
+
+
+class LocalCache:
+    """
+    Size-bounded in-process LRU cache with per-entry timeouts. Entries
+    are dropped when the process itself invalidates any of their tags,
+    invalidations made by other processes are only seen by checking
+    the tag versions, see `get_local_tag_versions`.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, _, value = item
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout, tags=()):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, frozenset(map(get_tag, tags)), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_tags(self, tags):
+        tags = set(map(get_tag, tags))
+        with self._lock:
+            for key in [key for key, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalCache()
+local_tag_versions = LocalCache(max_entries=1024)
+
+
+def get_tag(tag) -> str:
+    """Returns the tag of a model class or instance, e.g. `recipe.recipe`, strings are returned as is."""
+    return tag if isinstance(tag, str) else tag._meta.label_lower
+
+
+def _get_tag_version_keys(tags) -> list:
+    return [TAG_VERSION_KEY.format(tag=get_tag(tag)) for tag in tags]
+
+
+def invalidate_cache_tags(*tags):
+    """
+    Assigns new versions to the tags, so every entry cached with any of
+    them becomes stale. Versions are random to make an evicted version
+    key never match the entries cached before.
+    """
+    versions = {key: uuid4().hex for key in _get_tag_version_keys(tags)}
+    cache.set_many(versions, None)
+    local_cache.invalidate_tags(tags)
+    for key, version in versions.items():
+        local_tag_versions.set(key, version, LOCAL_VERSIONS_TIMEOUT)
+
 
+def _get_tag_versions(version_keys, cached_versions) -> tuple:
+    versions = []
+    for key in version_keys:
+        version = cached_versions.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, None)
+            version = cache.get(key)
+        versions.append(version)
+    return tuple(versions)
 
-def get_cached_data_or_set_new(key: str, default: callable, timeout: int):
+
+def get_tag_versions(*tags) -> tuple:
+    """Returns the current versions of the tags, they change whenever data of any tag changes."""
+    version_keys = _get_tag_version_keys(tags)
+    return _get_tag_versions(version_keys, cache.get_many(version_keys))
+
+
+def get_local_tag_versions(*tags) -> tuple:
+    """
+    Returns the versions of the tags as seen by this process. They are
+    read from the shared cache at most once per LOCAL_VERSIONS_TIMEOUT
+    seconds, invalidations made by this process apply at once.
+    """
+    version_keys = _get_tag_version_keys(tags)
+    versions = {key: local_tag_versions.get(key) for key in version_keys}
+    missing_keys = [key for key, version in versions.items() if version is None]
+    if missing_keys:
+        read_versions = _get_tag_versions(missing_keys, cache.get_many(missing_keys))
+        for key, version in zip(missing_keys, read_versions):
+            versions[key] = version
+            local_tag_versions.set(key, version, LOCAL_VERSIONS_TIMEOUT)
+    return tuple(versions[key] for key in version_keys)
+
+
+def _acquire_lock(key):
+    token = uuid4().hex
+    return token if cache.add(LOCK_KEY.format(key=key), token, LOCK_TIMEOUT) else None
+
+
+@lru_cache
+def _get_release_lock_script():
+    return get_redis_connection('default').register_script(RELEASE_LOCK_SCRIPT)
+
+
+def _release_lock(key, token):
+    lock_key = cache.client.make_key(LOCK_KEY.format(key=key))
+    _get_release_lock_script()(keys=(lock_key,), args=(cache.client.encode(token),))
+
+
+def _compute_and_set(key, default, timeout, versions) -> CacheEntry:
+    started_at = time.time()
+    data = default()
+    compute_time = time.time() - started_at
+
+    entry = CacheEntry(versions=versions, data=data, expires_at=time.time() + timeout, compute_time=compute_time)
+    cache.set(key, entry, timeout + STALE_TIMEOUT)
+    return entry
+
+
+def _wait_for_entry(key, version_keys) -> tuple:
+    """
+    Waits for the worker holding the lock to store an entry matching the
+    current tag versions. Returns the entry, or None once the lock is gone
+    without one, e.g. the worker failed or the tags were invalidated
+    meanwhile, along with the current versions.
+    """
+    lock_key = LOCK_KEY.format(key=key)
+    deadline = time.time() + LOCK_TIMEOUT
+    while True:
+        time.sleep(LOCK_WAIT_INTERVAL)
+        cached = cache.get_many([key, lock_key, *version_keys])
+        versions = _get_tag_versions(version_keys, cached)
+        entry = cached.get(key)
+        if isinstance(entry, CacheEntry) and entry.versions == versions:
+            return entry, versions
+        if lock_key not in cached or time.time() >= deadline:
+            return None, versions
+
+
+def _get_entry(key, default, timeout, tags, beta) -> tuple:
+    """Returns the entry of the key and whether it matches the current versions of its tags."""
+    version_keys = _get_tag_version_keys(tags)
+    cached = cache.get_many([key, *version_keys])
+    versions = _get_tag_versions(version_keys, cached)
+
+    entry = cached.get(key)
+    if not isinstance(entry, CacheEntry):
+        entry = None
+
+    if entry is not None and entry.is_fresh(versions) and not entry.should_refresh_early(beta):
+        return entry, True
+
+    token = _acquire_lock(key)
+    if token is None:
+        if entry is not None:
+            return entry, entry.is_fresh(versions)
+        entry, versions = _wait_for_entry(key, version_keys)
+        if entry is not None:
+            return entry, True
+        return _compute_and_set(key, default, timeout, versions), True
+
+    try:
+        return _compute_and_set(key, default, timeout, versions), True
+    finally:
+        _release_lock(key, token)
+
+
+def get_cached_data_or_set_new(key: str, default: callable, timeout: int, tags=(), beta: float = 1.0,
+                               local_timeout: int = None):
     """
     Checks if the cache exists for the given key. If not present,
     it caches the data obtained from calling the default function for
     timeout seconds.
+
+    Tags declare the models the data depends on, the entry is stored
+    along with their versions and is considered missing once any of
+    them is invalidated. The entry and the tag versions are fetched
+    with a single request to the cache.
+
+    Only one worker recomputes missing or stale data at a time, the
+    others serve the stale entry meanwhile or, if there is none, wait
+    for the new one while the lock is held. Entries are kept for STALE_TIMEOUT seconds after
+    expiry to be served as stale and are refreshed a bit before expiry
+    with a probability controlled by beta.
+
+    With local_timeout the entry is also kept in the memory of the
+    process for up to local_timeout seconds and served from there without
+    any request to the shared cache. Invalidations made by this process
+    apply at once, the ones made by other processes within
+    LOCAL_VERSIONS_TIMEOUT seconds, see `get_local_tag_versions`.
     """
-    data = cache.get(key)
-    if not data:
-        data = default()
-        cache.set(key, data, timeout)
-    return data
+    if local_timeout:
+        entry = local_cache.get(key)
+        if entry is not None and entry.is_fresh(get_local_tag_versions(*tags)):
+            return entry.data
+
+    entry, is_current = _get_entry(key, default, timeout, tags, beta)
+    if local_timeout and is_current:
+        local_cache.set(key, entry, min(local_timeout, entry.expires_at - time.time()), tags)
+        # The versions were just read along with the entry, so the next local hits need no request either.
+        for version_key, version in zip(_get_tag_version_keys(tags), entry.versions):
+            local_tag_versions.set(version_key, version, LOCAL_VERSIONS_TIMEOUT)
+    return entry.data
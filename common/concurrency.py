@@ -0,0 +1,21 @@
+from asgiref.sync import sync_to_async
+
+
+def to_thread(func, *args, **kwargs):
+    """
+    Runs a blocking call which talks only to Redis or the cache in the
+    thread pool, so several of them run concurrently. Calls which may
+    query the database must use `to_db_thread` instead.
+    """
+    return sync_to_async(func, thread_sensitive=False)(*args, **kwargs)
+
+
+def to_db_thread(func, *args, **kwargs):
+    """Runs a blocking call which may query the database in the thread owning the connection of the request."""
+    return sync_to_async(func)(*args, **kwargs)
+
+
+async def aget_user(request):
+    """Evaluates the lazy `request.user` off the event loop, as it reads the session and the database."""
+    await to_db_thread(lambda: request.user.is_authenticated)
+    return request.user
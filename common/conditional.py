@@ -0,0 +1,26 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts) -> str:
+    """Returns a quoted ETag made of the parts, e.g. version stamps of the data a response shows."""
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def get_not_modified_response(request, etag=None, last_modified=None):
+    """
+    Returns a 304 response if the validators sent by the client match,
+    otherwise None. It is meant to be called before the body is rendered.
+    """
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
@@ -0,0 +1,85 @@
+import threading
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+class PrecomputedData:
+    """
+    Data computed from the database off the request path, e.g. in-memory
+    indexes, and shared by every process through the cache.
+
+    `refresh` computes the data, usually in a Celery task, and stores it
+    along with a new version. Readers only compare that version with the
+    one of their in-memory copy and load the stored data once it changes,
+    so requests never compute it, except while nothing is stored yet, e.g.
+    on the first start. Writes in a burst are coalesced into a single
+    refresh by `schedule_refresh`.
+    """
+    key = None
+    refresh_delay = 5
+    # The refresh may be lost, e.g. with a worker, so pending refreshes are forgotten after a while.
+    pending_timeout = 60 * 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = None
+
+    @property
+    def _version_key(self) -> str:
+        return f'{self.key}:version'
+
+    @property
+    def _data_key(self) -> str:
+        return f'{self.key}:data'
+
+    @property
+    def _pending_key(self) -> str:
+        return f'{self.key}:pending'
+
+    def compute(self, version):
+        raise NotImplementedError
+
+    def refresh(self):
+        """Computes the data, shares it with every process and returns it."""
+        cache.delete(self._pending_key)
+        version = uuid4().hex
+        data = self.compute(version)
+        # The data is stored first, so the version never points to older data.
+        cache.set(self._data_key, data, None)
+        cache.set(self._version_key, version, None)
+        self._local = (version, data)
+        return data
+
+    def get(self):
+        """Returns the data stored by the latest refresh with a single small request while it is unchanged."""
+        version = cache.get(self._version_key)
+        local = self._local
+        if local is not None and local[0] == version:
+            return local[1]
+
+        data = cache.get(self._data_key) if version is not None else None
+        if data is None:
+            with self._lock:
+                local = self._local
+                if local is not None and local[0] == cache.get(self._version_key):
+                    return local[1]
+                return self.refresh()
+
+        # Copies are kept by the version they were loaded for, even if a concurrent refresh stored newer data.
+        self._local = (version, data)
+        return data
+
+    def get_local(self):
+        """Returns the copy loaded by this process, if any, without checking its version."""
+        local = self._local
+        return local[1] if local is not None else None
+
+    def schedule_refresh(self, task):
+        """Runs the refresh task once the current transaction commits, unless it is already pending."""
+        def schedule():
+            if cache.add(self._pending_key, True, self.pending_timeout):
+                task.apply_async(countdown=self.refresh_delay)
+
+        transaction.on_commit(schedule)
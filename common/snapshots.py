@@ -0,0 +1,167 @@
+import zlib
+
+import msgpack
+from django.apps import apps
+
+COMPRESSION_LEVEL = 6
+
+
+def _unpack_snapshot(model_label, packed):
+    columns, fields, select_related, live_fields, ordering, rows = msgpack.unpackb(
+        zlib.decompress(packed), use_list=False, timestamp=3,
+    )
+    return Snapshot(apps.get_model(model_label), columns, list(rows), fields, select_related, live_fields, ordering)
+
+
+class Snapshot:
+    """
+    Evaluated rows of a model kept as plain tuples, so they are compact to
+    cache and cheap to filter, sort and slice in memory. Model instances are
+    built only for the rows actually returned, e.g. the current page.
+
+    Pickling packs the rows with msgpack and zlib, so a snapshot stored in
+    the cache costs a fraction of a pickled QuerySet. Only msgpack native
+    values and aware datetimes are supported, e.g. numbers, strings and None.
+
+    Columns of `select_related` foreign keys are stored along with the rows
+    and can be filtered and sorted on like `category__slug`. Values of
+    `live_fields` change too often to be cached, they are read from the
+    database for the returned rows only.
+
+    Rows keep the ordering of the queryset they were read from, ordering
+    by a prefix of it and filtering keep the rows as they are, so default
+    list pages are neither sorted nor scanned in memory.
+    """
+
+    def __init__(self, model, columns, rows, fields, select_related=(), live_fields=(), ordering=()):
+        self.model = model
+        self.columns = tuple(columns)
+        self.rows = rows
+        self.fields = tuple(fields)
+        self.select_related = tuple(select_related)
+        self.live_fields = tuple(live_fields)
+        self.ordering = tuple(ordering)
+        self._positions = {column: position for position, column in enumerate(self.columns)}
+        self._pk_index = None
+        self._column_indexes = {}
+
+    @classmethod
+    def from_queryset(cls, queryset, fields, select_related=(), live_fields=()):
+        columns = list(fields)
+        for name in select_related:
+            related_model = queryset.model._meta.get_field(name).related_model
+            columns += [f'{name}__{field.attname}' for field in related_model._meta.concrete_fields]
+        rows = [tuple(row) for row in queryset.values_list(*columns)]
+        ordering = queryset.query.order_by
+        if not all(isinstance(field, str) for field in ordering):
+            ordering = ()
+        return cls(queryset.model, columns, rows, fields, select_related, live_fields, ordering)
+
+    def __reduce__(self):
+        data = (self.columns, self.fields, self.select_related, self.live_fields, self.ordering, self.rows)
+        data = msgpack.packb(data, datetime=True)
+        return _unpack_snapshot, (self.model._meta.label, zlib.compress(data, COMPRESSION_LEVEL))
+
+    def _clone(self, rows, ordering=None):
+        return Snapshot(
+            self.model, self.columns, rows, self.fields, self.select_related, self.live_fields,
+            self.ordering if ordering is None else ordering,
+        )
+
+    def _get_column_index(self, column) -> dict:
+        """Returns rows grouped by the values of the column, built once per snapshot."""
+        index = self._column_indexes.get(column)
+        if index is None:
+            position = self._positions[column]
+            index = self._column_indexes[column] = {}
+            for row in self.rows:
+                index.setdefault(row[position], []).append(row)
+        return index
+
+    def filter(self, **lookups):
+        """Returns the rows equal to all the lookups, only exact lookups are supported."""
+        if not lookups:
+            return self._clone(self.rows)
+        (indexed_column, indexed_value), *lookups = lookups.items()
+        rows = self._get_column_index(indexed_column).get(indexed_value, [])
+        conditions = [(self._positions[column], value) for column, value in lookups]
+        return self._clone([
+            row for row in rows
+            if all(row[position] == value for position, value in conditions)
+        ])
+
+    def order_by(self, *fields):
+        if fields == self.ordering[:len(fields)]:
+            return self._clone(self.rows)
+        rows = list(self.rows)
+        for field in reversed(fields):
+            position = self._positions[field.lstrip('-')]
+            rows.sort(key=lambda row: (row[position] is not None, row[position]), reverse=field.startswith('-'))
+        return self._clone(rows, fields)
+
+    @property
+    def ordered(self):
+        return True
+
+    def count(self):
+        return len(self.rows)
+
+    def exists(self):
+        return bool(self.rows)
+
+    def values_list(self, field, flat=False) -> list:
+        """Returns the cached values of a column without building instances, only flat lists are supported."""
+        if not flat:
+            raise TypeError('Snapshot.values_list() supports only flat=True.')
+        position = self._positions[field]
+        return [row[position] for row in self.rows]
+
+    def in_bulk(self, id_list) -> dict:
+        """Returns instances of the rows with the given primary keys mapped by them."""
+        if self._pk_index is None:
+            position = self._positions[self.model._meta.pk.attname]
+            self._pk_index = {row[position]: row for row in self.rows}
+        rows = [self._pk_index[pk] for pk in dict.fromkeys(id_list) if pk in self._pk_index]
+        return {instance.pk: instance for instance in self._build(rows)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __bool__(self):
+        return self.exists()
+
+    def __iter__(self):
+        return iter(self._build(self.rows))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self._build(self.rows[item])
+        return self._build([self.rows[item]])[0]
+
+    def _build_related(self, row, name):
+        related_model = self.model._meta.get_field(name).related_model
+        attnames = [field.attname for field in related_model._meta.concrete_fields]
+        values = [row[self._positions[f'{name}__{attname}']] for attname in attnames]
+        return related_model.from_db(self.model._base_manager.db, attnames, values)
+
+    def _build(self, rows) -> list:
+        db = self.model._base_manager.db
+        field_positions = [self._positions[field] for field in self.fields]
+        instances = []
+        for row in rows:
+            instance = self.model.from_db(db, self.fields, [row[position] for position in field_positions])
+            for name in self.select_related:
+                setattr(instance, name, self._build_related(row, name))
+            instances.append(instance)
+
+        if self.live_fields and instances:
+            live_values = {
+                pk: values for pk, *values in self.model._base_manager.filter(
+                    pk__in=[instance.pk for instance in instances],
+                ).values_list('pk', *self.live_fields)
+            }
+            instances = [instance for instance in instances if instance.pk in live_values]
+            for instance in instances:
+                for field, value in zip(self.live_fields, live_values[instance.pk]):
+                    setattr(instance, field, value)
+        return instances
@@ -1,10 +1,22 @@
 import logging
+import pickle
+import threading
+import time
 from dataclasses import dataclass
+from unittest import mock
 
+from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.authtoken.models import Token
 
 from accounts.models import User
+from common.cache import (LOCK_KEY, LOCK_TIMEOUT, LOCK_WAIT_INTERVAL,
+                          TAG_VERSION_KEY, LocalCache, _release_lock,
+                          get_cached_data_or_set_new, invalidate_cache_tags,
+                          local_cache, local_tag_versions)
+from common.precomputed import PrecomputedData
+from common.snapshots import Snapshot
+from recipe.models import Category, Recipe
 
 
 @dataclass(frozen=True)
@@ -57,3 +69,233 @@ class DisableLoggingMixin(TestCase):
         """Restore the normal log level."""
         logger = logging.getLogger('django.request')
         logger.setLevel(self.previous_level)
+
+
+class CacheTagsTestCase(TestCase):
+    key = 'test_cache_tags'
+
+    def setUp(self):
+        self.calls = 0
+
+    def tearDown(self):
+        cache.delete_many([self.key, LOCK_KEY.format(key=self.key)])
+        local_cache.clear()
+        local_tag_versions.clear()
+
+    def _get_data(self):
+        self.calls += 1
+        return [self.calls]
+
+    def _get_empty_data(self):
+        self.calls += 1
+        return []
+
+    def _get_cached(self):
+        return get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,))
+
+    def test_cached_until_invalidated(self):
+        self.assertEqual(self._get_cached(), [1])
+        self.assertEqual(self._get_cached(), [1])
+
+        invalidate_cache_tags(Category)
+
+        self.assertEqual(self._get_cached(), [2])
+
+    def test_invalidated_by_model_signal(self):
+        self._get_cached()
+
+        Category.objects.create(name='Test', slug='test')
+
+        self.assertEqual(self._get_cached(), [2])
+
+    def test_falsy_data_cached(self):
+        get_cached_data_or_set_new(self.key, self._get_empty_data, 60)
+        get_cached_data_or_set_new(self.key, self._get_empty_data, 60)
+
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_data_served_while_recomputed_elsewhere(self):
+        self._get_cached()
+        invalidate_cache_tags(Category)
+        cache.add(LOCK_KEY.format(key=self.key), 'another-worker', 60)
+
+        self.assertEqual(self._get_cached(), [1])
+        self.assertEqual(self.calls, 1)
+
+    def test_waiters_compute_once_lock_is_gone(self):
+        lock_key = LOCK_KEY.format(key=self.key)
+        cache.add(lock_key, 'failed-worker', 60)
+        threading.Timer(LOCK_WAIT_INTERVAL * 2, cache.delete, (lock_key,)).start()
+
+        started_at = time.monotonic()
+        self.assertEqual(self._get_cached(), [1])
+        self.assertLess(time.monotonic() - started_at, LOCK_TIMEOUT / 2)
+
+    def test_lock_released_by_its_owner_only(self):
+        lock_key = LOCK_KEY.format(key=self.key)
+        cache.add(lock_key, 'another-worker', 60)
+
+        _release_lock(self.key, 'expired-token')
+        self.assertEqual(cache.get(lock_key), 'another-worker')
+
+        _release_lock(self.key, 'another-worker')
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_local_cache_skips_shared_cache(self):
+        get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,), local_timeout=10)
+        cache.delete(self.key)
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.assertEqual(
+                get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,), local_timeout=10), [1]
+            )
+        get_many.assert_not_called()
+        self.assertEqual(self.calls, 1)
+
+    def test_local_cache_invalidated_by_tags(self):
+        get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,), local_timeout=10)
+
+        Category.objects.create(name='Test', slug='test')
+
+        self.assertEqual(
+            get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,), local_timeout=10), [2]
+        )
+
+    def test_local_cache_invalidated_by_other_process(self):
+        get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,), local_timeout=10)
+
+        # Another process only changes the shared tag version.
+        cache.set(TAG_VERSION_KEY.format(tag='recipe.category'), 'changed', None)
+
+        self.assertEqual(
+            get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,), local_timeout=10), [1]
+        )
+
+        # The versions seen by this process expire after LOCAL_VERSIONS_TIMEOUT.
+        local_tag_versions.clear()
+
+        self.assertEqual(
+            get_cached_data_or_set_new(self.key, self._get_data, 60, tags=(Category,), local_timeout=10), [2]
+        )
+
+
+class LocalCacheTestCase(TestCase):
+    def test_least_recently_used_evicted(self):
+        local = LocalCache(max_entries=2)
+        local.set('first', 1, 60)
+        local.set('second', 2, 60)
+        local.get('first')
+        local.set('third', 3, 60)
+
+        self.assertEqual(local.get('first'), 1)
+        self.assertIsNone(local.get('second'))
+        self.assertEqual(local.get('third'), 3)
+
+    def test_expired(self):
+        local = LocalCache()
+        local.set('key', 1, 0)
+
+        self.assertIsNone(local.get('key'))
+
+    def test_invalidate_tags(self):
+        local = LocalCache()
+        local.set('categories', 1, 60, tags=(Category,))
+        local.set('other', 2, 60, tags=('interactions.recipebookmark',))
+
+        local.invalidate_tags((Category,))
+
+        self.assertIsNone(local.get('categories'))
+        self.assertEqual(local.get('other'), 2)
+
+
+class SnapshotTestCase(TestCase):
+    fixtures = ('category.json', 'recipe.json')
+
+    def _get_snapshot(self):
+        return Snapshot.from_queryset(
+            Recipe.objects.all(), ('id', 'name', 'slug', 'category_id'), select_related=('category',),
+            live_fields=('views',),
+        )
+
+    def test_pickled_snapshot_restored(self):
+        snapshot = self._get_snapshot()
+
+        restored = pickle.loads(pickle.dumps(snapshot))
+
+        self.assertEqual(restored.rows, snapshot.rows)
+        self.assertEqual([recipe.id for recipe in restored], [recipe.id for recipe in snapshot])
+
+    def test_filtered_and_ordered_in_memory(self):
+        category = Category.objects.first()
+        expected = list(Recipe.objects.filter(category=category).order_by('-name', 'id').values_list('id', flat=True))
+
+        snapshot = self._get_snapshot()
+
+        with self.assertNumQueries(0):
+            snapshot = snapshot.filter(category__slug=category.slug).order_by('-name', 'id')
+
+        self.assertEqual(snapshot.count(), len(expected))
+        self.assertEqual([recipe.id for recipe in snapshot], expected)
+
+    def test_ordering_of_queryset_kept(self):
+        snapshot = Snapshot.from_queryset(Recipe.objects.order_by('name', 'id'), ('id', 'name', 'category_id'))
+        category_id = snapshot[0].category_id
+
+        filtered = snapshot.filter(category_id=category_id).order_by('name')
+
+        self.assertEqual(filtered.ordering, ('name', 'id'))
+        self.assertEqual(
+            [recipe.id for recipe in filtered],
+            list(Recipe.objects.filter(category_id=category_id).order_by('name', 'id').values_list('id', flat=True)),
+        )
+
+    def test_page_built_with_related_and_live_fields(self):
+        snapshot = self._get_snapshot().order_by('id')
+        recipe = Recipe.objects.select_related('category').order_by('id').first()
+        Recipe.objects.filter(id=recipe.id).update(views=42)
+
+        with self.assertNumQueries(1):
+            page = snapshot[:2]
+            self.assertEqual(page[0].category.slug, recipe.category.slug)
+        self.assertEqual(page[0].views, 42)
+
+
+class PrecomputedDataTestCase(TestCase):
+    class Counted(PrecomputedData):
+        key = 'test_precomputed'
+
+        def __init__(self):
+            super().__init__()
+            self.computed = 0
+
+        def compute(self, version):
+            self.computed += 1
+            return [self.computed]
+
+    def tearDown(self):
+        cache.delete_pattern('test_precomputed:*')
+
+    def test_computed_once_and_loaded_by_other_processes(self):
+        worker, other_worker = self.Counted(), self.Counted()
+
+        self.assertEqual(worker.get(), [1])
+        self.assertEqual(other_worker.get(), [1])
+        self.assertEqual(other_worker.computed, 0)
+
+        worker.refresh()
+
+        self.assertEqual(other_worker.get(), [2])
+        self.assertEqual(other_worker.computed, 0)
+
+    def test_refresh_scheduled_once_on_commit(self):
+        data, task = self.Counted(), mock.Mock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            data.schedule_refresh(task)
+            data.schedule_refresh(task)
+
+        task.apply_async.assert_called_once_with(countdown=data.refresh_delay)
+        data.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            data.schedule_refresh(task)
+        self.assertEqual(task.apply_async.call_count, 2)
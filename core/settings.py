@@ -302,6 +302,21 @@ CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}'
 
 CELERY_TASK_TIME_LIMIT = 30 * 60
 
+CELERY_BEAT_SCHEDULE = {
+    'flush-recipe-views': {
+        'task': 'recipe.tasks.flush_recipe_views',
+        'schedule': 60,
+    },
+    'rebase-trending-scores': {
+        'task': 'recipe.tasks.rebase_trending_scores',
+        'schedule': 60 * 60,
+    },
+    'build-related-recipes': {
+        'task': 'recipe.tasks.build_related_recipes',
+        'schedule': 60 * 60 * 24,
+    },
+}
+
 # Rest framework
 
 REST_FRAMEWORK = {
@@ -1,7 +1,12 @@
 #!/bin/sh
 
 python manage.py makemigrations --no-input
+python manage.py remove_duplicate_bookmarks
 python manage.py migrate --no-input
+python manage.py rebuild_search_index --missing
+python manage.py reconcile_bookmarks_count
+python manage.py reconcile_comments_count
+python manage.py generate_image_variants
 python manage.py collectstatic --no-input
 
-gunicorn core.wsgi:application --bind 0.0.0.0:8000
+gunicorn core.asgi:application --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
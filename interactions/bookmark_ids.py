@@ -0,0 +1,102 @@
+from django_redis import get_redis_connection
+from redis.exceptions import WatchError
+
+USER_BOOKMARKS_KEY = 'recipe_bookmarks:{user_id}'
+# Bumped by every change of the bookmarks of the user, a set read from the database meanwhile is not stored.
+USER_BOOKMARKS_GENERATION_KEY = 'recipe_bookmarks:{user_id}:generation'
+USER_BOOKMARKS_TIMEOUT = 60 * 60
+# Redis drops empty sets, the marker keeps the set of a user without bookmarks cached. Recipe ids start with 1.
+EMPTY_MARKER = 0
+
+# Changes the set only while it is cached, otherwise the next read loads it from the database.
+UPDATE_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[2] == 'add' then
+    redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+else
+    redis.call('SREM', KEYS[1], unpack(ARGV, 3))
+end
+return 1
+"""
+
+
+def _get_key(user_id) -> str:
+    return USER_BOOKMARKS_KEY.format(user_id=user_id)
+
+
+def _get_generation_key(user_id) -> str:
+    return USER_BOOKMARKS_GENERATION_KEY.format(user_id=user_id)
+
+
+def _load(redis, user_id) -> set:
+    """
+    Reads the bookmarks of the user from the database and caches them unless
+    the set has been cached or the bookmarks changed in the meantime, the
+    ids read before a concurrent change are then returned but not stored.
+    """
+    from interactions.models import RecipeBookmark
+
+    key = _get_key(user_id)
+    with redis.pipeline(transaction=True) as pipeline:
+        pipeline.watch(key, _get_generation_key(user_id))
+        recipe_ids = set(RecipeBookmark.objects.filter(user_id=user_id).values_list('recipe_id', flat=True))
+        if pipeline.exists(key):
+            return recipe_ids
+        pipeline.multi()
+        pipeline.sadd(key, EMPTY_MARKER, *recipe_ids)
+        pipeline.expire(key, USER_BOOKMARKS_TIMEOUT)
+        try:
+            pipeline.execute()
+        except WatchError:
+            pass
+    return recipe_ids
+
+
+def get_bookmarked_ids(user_id, recipe_ids) -> set:
+    """Returns which of the recipes the user bookmarked, with one O(len(recipe_ids)) round trip once cached."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return set()
+
+    redis = get_redis_connection('default')
+    with redis.pipeline(transaction=False) as pipeline:
+        pipeline.exists(_get_key(user_id))
+        pipeline.smismember(_get_key(user_id), recipe_ids)
+        exists, flags = pipeline.execute()
+    if not exists:
+        return _load(redis, user_id).intersection(recipe_ids)
+    return {recipe_id for recipe_id, flag in zip(recipe_ids, flags) if flag}
+
+
+def get_all_bookmarked_ids(user_id) -> set:
+    redis = get_redis_connection('default')
+    members = redis.smembers(_get_key(user_id))
+    if not members:
+        return _load(redis, user_id)
+    return {int(member) for member in members} - {EMPTY_MARKER}
+
+
+def _update(user_id, recipe_ids, operation):
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        script = get_redis_connection('default').register_script(UPDATE_SCRIPT)
+        script(
+            keys=(_get_key(user_id), _get_generation_key(user_id)),
+            args=(USER_BOOKMARKS_TIMEOUT, operation, *recipe_ids),
+        )
+
+
+def add_bookmarked_ids(user_id, recipe_ids):
+    _update(user_id, recipe_ids, 'add')
+
+
+def remove_bookmarked_ids(user_id, recipe_ids):
+    _update(user_id, recipe_ids, 'remove')
+
+
+def forget_user(user_id):
+    get_redis_connection('default').delete(_get_key(user_id), _get_generation_key(user_id))
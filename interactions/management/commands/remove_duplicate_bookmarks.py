@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from interactions.models import RecipeBookmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Removes repeated bookmarks of the same recipe by the same user, keeping the earliest one. '
+        'Runs before the migration adding the unique constraint, recount the bookmarks afterwards.'
+    )
+
+    def handle(self, *args, **options):
+        table = RecipeBookmark._meta.db_table
+        if table not in connection.introspection.table_names():
+            self.stdout.write(self.style.SUCCESS('Removed 0 duplicate bookmarks.'))
+            return
+
+        # Raw SQL keeps delete signals away, they update counters which may not be migrated yet.
+        quoted_table = connection.ops.quote_name(table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quoted_table} WHERE id NOT IN '
+                f'(SELECT MIN(id) FROM {quoted_table} GROUP BY user_id, recipe_id)'
+            )
+            removed = cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} duplicate bookmarks.'))
@@ -1,7 +1,78 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from interactions.bookmark_ids import get_all_bookmarked_ids
 
 
 class RecipeBookmarkManager(models.Manager):
+    # Columns of recipes shown on cards, long texts are not loaded for bookmark pages.
+    recipe_card_fields = (
+        'id', 'image', 'image_variants', 'name', 'slug', 'description', 'bookmarks_count', 'comments_count', 'views',
+    )
 
     def user_bookmarks(self, user_id):
-        return self.filter(user_id=user_id).prefetch_related('recipe__bookmarks', 'recipe')
+        """Returns bookmarks of the user joined with their recipes, counts come from the denormalized counters."""
+        return self.filter(user_id=user_id).select_related('recipe').only(
+            'id', 'created_date', 'user_id', 'recipe', *(f'recipe__{field}' for field in self.recipe_card_fields),
+        )
+
+    def user_recipe_ids(self, user_id) -> set:
+        """Returns ids of all the recipes bookmarked by the user from their cached set."""
+        return get_all_bookmarked_ids(user_id)
+
+    def _get_quoted_names(self) -> dict:
+        from recipe.models import Recipe
+
+        quote_name = connection.ops.quote_name
+        return {
+            'table': quote_name(self.model._meta.db_table),
+            'recipe': quote_name(self.model._meta.get_field('recipe').column),
+            'user': quote_name(self.model._meta.get_field('user').column),
+            'created_date': quote_name(self.model._meta.get_field('created_date').column),
+            'recipe_table': quote_name(Recipe._meta.db_table),
+            'recipe_id': quote_name(Recipe._meta.pk.column),
+        }
+
+    def _execute_returning_recipe_ids(self, sql, params) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _insert(self, user_id, recipe_ids) -> list:
+        names = self._get_quoted_names()
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        return self._execute_returning_recipe_ids(
+            f'INSERT INTO {names["table"]} ({names["recipe"]}, {names["user"]}, {names["created_date"]}) '
+            f'SELECT {names["recipe_id"]}, %s, %s FROM {names["recipe_table"]} '
+            f'WHERE {names["recipe_id"]} IN ({placeholders}) '
+            f'ON CONFLICT ({names["user"]}, {names["recipe"]}) DO NOTHING '
+            f'RETURNING {names["recipe"]}',
+            [user_id, connection.ops.adapt_datetimefield_value(timezone.now()), *recipe_ids],
+        )
+
+    def _delete(self, user_id, recipe_ids) -> list:
+        names = self._get_quoted_names()
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        return self._execute_returning_recipe_ids(
+            f'DELETE FROM {names["table"]} '
+            f'WHERE {names["user"]} = %s AND {names["recipe"]} IN ({placeholders}) '
+            f'RETURNING {names["recipe"]}',
+            [user_id, *recipe_ids],
+        )
+
+    def sync(self, user_id, add=(), remove=()) -> tuple:
+        """
+        Bookmarks and unbookmarks recipes for the user with one
+        `INSERT ... ON CONFLICT DO NOTHING` and one `DELETE`, so replays and
+        concurrent requests are no-ops. Unknown recipes are skipped.
+        Returns ids of the recipes that were actually added and removed.
+        """
+        from interactions.signals import bookmarks_synced
+
+        add, remove = sorted(set(add)), sorted(set(remove))
+        with transaction.atomic():
+            added = self._insert(user_id, add) if add else []
+            removed = self._delete(user_id, remove) if remove else []
+            if added or removed:
+                bookmarks_synced.send(sender=self.model, user_id=user_id, added=added, removed=removed)
+        return added, removed
@@ -10,6 +10,14 @@ class RecipeBookmark(models.Model):
 
     objects = RecipeBookmarkManager()
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'recipe'), name='unique_recipe_bookmark'),
+        )
+        indexes = (
+            models.Index(fields=('user', '-created_date', 'id'), name='recipe_bookmark_user_date_idx'),
+        )
+
     def __str__(self):
         return f'{self.user.username} | {self.recipe.name}'
 
@@ -20,5 +28,10 @@ class RecipeComment(models.Model):
     text = models.CharField(max_length=516)
     created_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = (
+            models.Index(fields=('recipe', '-created_date', 'id'), name='recipe_comment_date_idx'),
+        )
+
     def __str__(self):
         return self.text
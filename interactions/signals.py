@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from common.cache import invalidate_cache_tags
+from interactions.bookmark_ids import (add_bookmarked_ids, forget_user,
+                                       remove_bookmarked_ids)
+from interactions.models import RecipeBookmark, RecipeComment
+from recipe.feed import recipe_feed
+from recipe.models import Recipe
+from recipe.trending import BOOKMARK_WEIGHT, record_event
+
+# Sent by `RecipeBookmark.objects.sync` with ids of the recipes the user bookmarked and unbookmarked,
+# its raw INSERT and DELETE send neither post_save nor post_delete.
+bookmarks_synced = Signal()
+
+
+def _on_bookmarks_changed(user_id, recipe_ids, added=True):
+    """
+    Records trending events and updates the feed profile and the cached
+    bookmarked ids of the user once the transaction commits, so rolled back
+    bookmarks leave nothing behind in Redis. The denormalized counter is
+    changed in the transaction itself.
+    """
+    recipe_ids = list(recipe_ids)
+    weight = BOOKMARK_WEIGHT if added else -BOOKMARK_WEIGHT
+
+    def apply():
+        for recipe_id in recipe_ids:
+            record_event(recipe_id, weight)
+        recipe_feed.update_profile(user_id, recipe_ids, added=added)
+        if added:
+            add_bookmarked_ids(user_id, recipe_ids)
+        else:
+            remove_bookmarked_ids(user_id, recipe_ids)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=RecipeBookmark)
+def increment_bookmarks_count(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Recipe.objects.change_bookmarks_count([instance.recipe_id], 1)
+        _on_bookmarks_changed(instance.user_id, [instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.bookmarks.through)
+def increment_bookmarks_count_on_add(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    `recipe.bookmarks.add` inserts rows with bulk_create, which sends no post_save,
+    pk_set holds only the rows that were actually added. Removals are counted
+    by post_delete, which is sent for every deleted row.
+    """
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        Recipe.objects.change_bookmarks_count(pk_set, 1)
+        _on_bookmarks_changed(instance.id, pk_set)
+    else:
+        Recipe.objects.change_bookmarks_count([instance.id], len(pk_set))
+        for user_id in pk_set:
+            _on_bookmarks_changed(user_id, [instance.id])
+
+
+@receiver(post_delete, sender=RecipeBookmark)
+def decrement_bookmarks_count(sender, instance, **kwargs):
+    Recipe.objects.change_bookmarks_count([instance.recipe_id], -1)
+    _on_bookmarks_changed(instance.user_id, [instance.recipe_id], added=False)
+
+
+@receiver(bookmarks_synced, sender=RecipeBookmark)
+def change_synced_bookmarks_count(sender, user_id, added, removed, **kwargs):
+    for recipe_ids, delta in ((added, 1), (removed, -1)):
+        if recipe_ids:
+            Recipe.objects.change_bookmarks_count(recipe_ids, delta)
+            _on_bookmarks_changed(user_id, recipe_ids, added=delta > 0)
+
+
+@receiver(post_save, sender=RecipeComment)
+def increment_comments_count(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Recipe.objects.change_comments_count([instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=RecipeComment)
+def decrement_comments_count(sender, instance, **kwargs):
+    Recipe.objects.change_comments_count([instance.recipe_id], -1)
+
+
+@receiver(post_save, sender='accounts.User')
+def reset_new_user_bookmarks(sender, instance, created, raw=False, **kwargs):
+    """Drops a cached bookmarks set left by a deleted user whose id the database reused."""
+    if created and not raw:
+        forget_user(instance.id)
+
+
+@receiver(post_save, sender=RecipeBookmark)
+@receiver(post_delete, sender=RecipeBookmark)
+@receiver(bookmarks_synced, sender=RecipeBookmark)
+@receiver(post_save, sender=RecipeComment)
+@receiver(post_delete, sender=RecipeComment)
+def invalidate_interactions_cache(sender, **kwargs):
+    invalidate_cache_tags(sender)
+
+
+@receiver(m2m_changed, sender=Recipe.bookmarks.through)
+def invalidate_bookmarks_cache(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_cache_tags(sender)
@@ -1,10 +1,19 @@
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from common.tests import TestUser
-from interactions.models import RecipeBookmark
+from interactions.bookmark_ids import (add_bookmarked_ids,
+                                       get_all_bookmarked_ids,
+                                       get_bookmarked_ids)
+from interactions.models import RecipeBookmark, RecipeComment
 from recipe.models import Recipe
 
 test_user = TestUser()
@@ -32,3 +41,209 @@ class BookmarksListViewTestCase(TestCase):
             response.context_data['object_list'],
             RecipeBookmark.objects.user_bookmarks(self.user)
         )
+
+    def test_pages_walked_by_cursor(self):
+        self._add_recipes_to_user_bookmarks(Recipe.objects.order_by('id')[:5])
+        expected_ids = list(
+            RecipeBookmark.objects.filter(user=self.user).order_by('-created_date', 'id').values_list('id', flat=True)
+        )
+
+        bookmark_ids, url = [], f'{self.path}?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertLessEqual(len(response.context_data['object_list']), 2)
+            bookmark_ids += [bookmark.id for bookmark in response.context_data['object_list']]
+            url = response.context_data['next_url']
+
+        self.assertEqual(bookmark_ids, expected_ids)
+        self.assertIsNotNone(response.context_data['previous_url'])
+
+    def test_queries_do_not_depend_on_page_size(self):
+        self._add_recipes_to_user_bookmarks(Recipe.objects.all()[:4])
+        self.client.get(self.path)
+
+        query_counts = []
+        for page_size in (1, 4):
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(self.path, {'page_size': page_size})
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.path, {'cursor': 'invalid'})
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class BookmarksCountTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.user = test_user.create_user()
+        self.recipe = Recipe.objects.first()
+
+    def _assert_bookmarks_count(self, expected):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.bookmarks_count, expected)
+
+    def test_add_and_remove(self):
+        self.recipe.bookmarks.add(self.user, through_defaults=None)
+        self.recipe.bookmarks.add(self.user, through_defaults=None)
+        self._assert_bookmarks_count(1)
+
+        self.recipe.bookmarks.remove(self.user)
+        self.recipe.bookmarks.remove(self.user)
+        self._assert_bookmarks_count(0)
+
+    def test_create_and_delete(self):
+        bookmark = RecipeBookmark.objects.create(recipe=self.recipe, user=self.user)
+        self._assert_bookmarks_count(1)
+
+        bookmark.delete()
+        self._assert_bookmarks_count(0)
+
+    def test_sync(self):
+        other_recipe = Recipe.objects.exclude(id=self.recipe.id).first()
+
+        added, removed = RecipeBookmark.objects.sync(self.user.id, add=[self.recipe.id, self.recipe.id, 0])
+        self.assertEqual((added, removed), ([self.recipe.id], []))
+        self._assert_bookmarks_count(1)
+
+        added, removed = RecipeBookmark.objects.sync(self.user.id, add=[self.recipe.id, other_recipe.id])
+        self.assertEqual((added, removed), ([other_recipe.id], []))
+        self._assert_bookmarks_count(1)
+
+        added, removed = RecipeBookmark.objects.sync(self.user.id, remove=[self.recipe.id])
+        self.assertEqual((added, removed), ([], [self.recipe.id]))
+        self._assert_bookmarks_count(0)
+
+        RecipeBookmark.objects.sync(self.user.id, remove=[self.recipe.id])
+        self._assert_bookmarks_count(0)
+        self.assertEqual(RecipeBookmark.objects.user_recipe_ids(self.user.id), {other_recipe.id})
+
+    def test_duplicate_bookmark_rejected(self):
+        RecipeBookmark.objects.create(recipe=self.recipe, user=self.user)
+
+        with self.assertRaises(IntegrityError):
+            RecipeBookmark.objects.create(recipe=self.recipe, user=self.user)
+
+    def test_save_does_not_overwrite_count(self):
+        stale_recipe = Recipe.objects.get(id=self.recipe.id)
+        self.recipe.bookmarks.add(self.user, through_defaults=None)
+
+        stale_recipe.save()
+
+        self._assert_bookmarks_count(1)
+
+    def test_reconcile_command(self):
+        self.recipe.bookmarks.add(self.user, through_defaults=None)
+        Recipe.objects.filter(id=self.recipe.id).update(bookmarks_count=10)
+
+        call_command('reconcile_bookmarks_count', batch_size=1, stdout=StringIO())
+
+        self._assert_bookmarks_count(1)
+
+
+class BookmarkIdsTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.user = test_user.create_user()
+        self.recipes = list(Recipe.objects.order_by('id')[:3])
+        self.recipe_ids = [recipe.id for recipe in self.recipes]
+
+    def test_loaded_once(self):
+        self.recipes[0].bookmarks.add(self.user, through_defaults=None)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_bookmarked_ids(self.user.id, self.recipe_ids), {self.recipe_ids[0]})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_bookmarked_ids(self.user.id, self.recipe_ids), {self.recipe_ids[0]})
+            self.assertEqual(get_all_bookmarked_ids(self.user.id), {self.recipe_ids[0]})
+
+    def test_empty_set_cached(self):
+        get_bookmarked_ids(self.user.id, self.recipe_ids)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_bookmarked_ids(self.user.id, self.recipe_ids), set())
+            self.assertEqual(get_all_bookmarked_ids(self.user.id), set())
+
+    def test_updated_on_bookmark_changes(self):
+        get_bookmarked_ids(self.user.id, self.recipe_ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].bookmarks.add(self.user, through_defaults=None)
+            RecipeBookmark.objects.create(recipe=self.recipes[1], user=self.user)
+            RecipeBookmark.objects.sync(self.user.id, add=[self.recipe_ids[2]], remove=[self.recipe_ids[1]])
+            self.recipes[0].bookmarks.remove(self.user)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_bookmarked_ids(self.user.id, self.recipe_ids), {self.recipe_ids[2]})
+
+    def test_rolled_back_bookmarks_not_cached(self):
+        get_bookmarked_ids(self.user.id, self.recipe_ids)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                RecipeBookmark.objects.create(recipe=self.recipes[0], user=self.user)
+                transaction.set_rollback(True)
+
+        self.assertEqual(get_bookmarked_ids(self.user.id, self.recipe_ids), set())
+        self.assertEqual(callbacks, [])
+
+    def test_set_read_before_a_change_not_stored(self):
+        def add_bookmark_meanwhile(*args, **kwargs):
+            add_bookmarked_ids(self.user.id, [self.recipe_ids[0]])
+            return queryset_values_list(*args, **kwargs)
+
+        queryset_values_list = QuerySet.values_list
+        with mock.patch.object(QuerySet, 'values_list', add_bookmark_meanwhile):
+            self.assertEqual(get_bookmarked_ids(self.user.id, self.recipe_ids), set())
+
+        RecipeBookmark.objects.create(recipe=self.recipes[0], user=self.user)
+        self.assertEqual(get_bookmarked_ids(self.user.id, self.recipe_ids), {self.recipe_ids[0]})
+
+    def test_reset_for_new_user(self):
+        user_id = self.user.id + 1
+        get_bookmarked_ids(user_id, self.recipe_ids)
+        add_bookmarked_ids(user_id, [self.recipe_ids[0]])
+
+        new_user = test_user.create_user(id=user_id, username='other', email='other@example.com')
+
+        self.assertEqual(get_bookmarked_ids(new_user.id, self.recipe_ids), set())
+
+
+class CommentsCountTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.user = test_user.create_user()
+        self.client.force_login(self.user)
+        self.recipe = Recipe.objects.first()
+
+    def _assert_comments_count(self, expected):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.comments_count, expected)
+
+    def test_add_and_remove(self):
+        comment = RecipeComment.objects.create(recipe=self.recipe, author=self.user, text='Tasty')
+        self._assert_comments_count(1)
+
+        self.client.post(reverse('interactions:comment-add', kwargs={'recipe_id': self.recipe.id}), {'text': 'Again'})
+        self._assert_comments_count(2)
+
+        self.client.post(reverse('api:recipe:comments-list'), {'recipe_id': self.recipe.id, 'text': 'And again'})
+        self._assert_comments_count(3)
+
+        comment.delete()
+        self._assert_comments_count(2)
+
+    def test_reconcile_command(self):
+        RecipeComment.objects.create(recipe=self.recipe, author=self.user, text='Tasty')
+        Recipe.objects.filter(id=self.recipe.id).update(comments_count=10)
+
+        call_command('reconcile_comments_count', batch_size=1, stdout=StringIO())
+
+        self._assert_comments_count(1)
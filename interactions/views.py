@@ -1,12 +1,18 @@
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.views.generic import FormView, ListView
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
 
+from api.recipe.pagination import BookmarkCursorPagination
 from common.urls import get_referer_or_default
 from common.views import TitleMixin
 from interactions.forms import RecipeCommentForm
 from interactions.models import RecipeBookmark, RecipeComment
+from recipe.counters import apply_pending_views
+from recipe.fragments import render_recipe_cards
 from recipe.models import Recipe
 
 
@@ -15,10 +21,30 @@ class BookmarksListView(LoginRequiredMixin, TitleMixin, ListView):
     template_name = 'recipe/recipe_bookmarks.html'
     ordering = ('-created_date',)
     title = 'Special Recipe | Bookmarks'
+    paginate_by = settings.RECIPES_PAGINATE_BY
+    pagination_class = BookmarkCursorPagination
 
     def get_queryset(self):
         queryset = self.model.objects.user_bookmarks(self.request.user)
-        return queryset.order_by(*self.ordering)[:settings.RECIPES_PAGINATE_BY]
+        return queryset.order_by(*self.ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        """Pages bookmarks by keyset like the API, so every page costs as much as the first one."""
+        paginator = self.pagination_class()
+        try:
+            object_list = paginator.paginate_queryset(queryset, Request(self.request), view=self)
+        except NotFound:
+            raise Http404
+        previous_url, next_url = paginator.get_previous_link(), paginator.get_next_link()
+        return paginator, None, object_list, bool(previous_url or next_url)
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data(object_list=object_list, **kwargs)
+        recipes = apply_pending_views(bookmark.recipe for bookmark in context['object_list'])
+        context['recipe_cards'] = render_recipe_cards(recipes, {recipe.id for recipe in recipes})
+        context['previous_url'] = context['paginator'].get_previous_link()
+        context['next_url'] = context['paginator'].get_next_link()
+        return context
 
 
 class AddCommentCreateView(LoginRequiredMixin, FormView):
@@ -26,7 +26,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(SummernoteModelAdmin):
-    readonly_fields = ('views',)
+    readonly_fields = ('views', 'bookmarks_count')
     summernote_fields = ('cooking_description',)
     search_fields = ('name',)
     ordering = ('name',)
@@ -0,0 +1,160 @@
+import hashlib
+import time
+
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from common.cache import invalidate_cache_tags
+from recipe import trending
+
+PENDING_VIEWS_KEY = 'recipe_views:pending'
+FLUSHING_VIEWS_KEY = 'recipe_views:flushing'
+FLUSH_LOCK_KEY = 'recipe_views:flush_lock'
+# Invalidated on every flush, so data showing views can be validated without reading them.
+VIEWS_CACHE_TAG = 'recipe.views'
+VIEWERS_FILTER_KEY = 'recipe_views:viewers:{recipe_id}:{window}'
+UNIQUE_VIEWERS_KEY = 'recipe_views:unique:{recipe_id}:{day}'
+
+DAY_SECONDS = 60 * 60 * 24
+VIEWERS_WINDOW_SECONDS = 60
+VIEWERS_FILTER_BITS = 2 ** 14
+VIEWERS_FILTER_HASHES = 4
+UNIQUE_VIEWERS_RETENTION_DAYS = 30
+
+# Sets the bloom filter bits of the viewer and returns their previous values in one call,
+# the view is new if at least one of them was not set yet. The viewer is also added
+# to the daily HyperLogLog and a new view is buffered in the pending views hash.
+REGISTER_VIEW_SCRIPT = """
+local arguments = {}
+for index = 5, #ARGV do
+    table.insert(arguments, 'SET')
+    table.insert(arguments, 'u1')
+    table.insert(arguments, ARGV[index])
+    table.insert(arguments, 1)
+end
+local previous_bits = redis.call('BITFIELD', KEYS[1], unpack(arguments))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PFADD', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+for _, bit in ipairs(previous_bits) do
+    if bit == 0 then
+        redis.call('HINCRBY', KEYS[3], ARGV[1], 1)
+        return 1
+    end
+end
+return 0
+"""
+
+
+def _get_filter_positions(viewer: str) -> list:
+    """Derives the bloom filter bit positions of the viewer with double hashing."""
+    digest = hashlib.blake2b(viewer.encode(), digest_size=16).digest()
+    first_hash, second_hash = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+    return [(first_hash + index * second_hash) % VIEWERS_FILTER_BITS for index in range(VIEWERS_FILTER_HASHES)]
+
+
+def register_view(recipe_id, viewer: str) -> bool:
+    """
+    Buffers a view of the recipe unless the viewer has already viewed it
+    within the current window, the buffered views are written to the
+    database by `flush_views`, new views also count towards trending.
+
+    Viewers are deduplicated with a bloom filter per recipe and window
+    instead of a key per viewer, so memory does not grow with the number
+    of visitors. Rare false positives drop a view, repeated views are
+    never counted.
+    """
+    now = time.time()
+    keys = (
+        VIEWERS_FILTER_KEY.format(recipe_id=recipe_id, window=int(now // VIEWERS_WINDOW_SECONDS)),
+        UNIQUE_VIEWERS_KEY.format(recipe_id=recipe_id, day=int(now // DAY_SECONDS)),
+        PENDING_VIEWS_KEY,
+    )
+    arguments = (
+        recipe_id,
+        viewer,
+        VIEWERS_WINDOW_SECONDS * 2,
+        UNIQUE_VIEWERS_RETENTION_DAYS * DAY_SECONDS,
+        *_get_filter_positions(viewer),
+    )
+    script = get_redis_connection('default').register_script(REGISTER_VIEW_SCRIPT)
+    is_new = bool(script(keys=keys, args=arguments))
+    if is_new:
+        trending.record_event(recipe_id, trending.VIEW_WEIGHT)
+    return is_new
+
+
+def get_unique_viewers(recipe_id, days=7) -> int:
+    """Returns the approximate number of unique viewers of the recipe for the last days."""
+    today = int(time.time() // DAY_SECONDS)
+    keys = [UNIQUE_VIEWERS_KEY.format(recipe_id=recipe_id, day=today - offset) for offset in range(days)]
+    return get_redis_connection('default').pfcount(*keys)
+
+
+def get_pending_views(recipe_ids) -> dict:
+    """Returns views of the recipes which are not flushed to the database yet."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return {}
+    redis = get_redis_connection('default')
+    with redis.pipeline(transaction=False) as pipeline:
+        pipeline.hmget(PENDING_VIEWS_KEY, recipe_ids)
+        pipeline.hmget(FLUSHING_VIEWS_KEY, recipe_ids)
+        pending, flushing = pipeline.execute()
+    return {
+        recipe_id: int(pending_views or 0) + int(flushing_views or 0)
+        for recipe_id, pending_views, flushing_views in zip(recipe_ids, pending, flushing)
+    }
+
+
+def apply_pending_views(recipes):
+    """Adds the buffered views to `views` of the recipe instances."""
+    recipes = [recipe for recipe in recipes if recipe is not None]
+    pending_views = get_pending_views(recipe.id for recipe in recipes)
+    for recipe in recipes:
+        recipe.views += pending_views.get(recipe.id, 0)
+    return recipes
+
+
+def flush_views(batch_size=500) -> int:
+    """
+    Moves the buffered views to the database with one
+    `UPDATE ... SET views = views + CASE id WHEN ... END` per batch.
+
+    The pending hash is renamed before it is read, so increments made
+    during the flush go to a new hash. If a previous flush failed,
+    its hash is flushed first instead.
+    """
+    from recipe.models import Recipe
+
+    redis = get_redis_connection('default')
+    lock = redis.lock(FLUSH_LOCK_KEY, timeout=60 * 5)
+    if not lock.acquire(blocking=False):
+        return 0
+
+    try:
+        if not redis.exists(FLUSHING_VIEWS_KEY):
+            try:
+                redis.rename(PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY)
+            except ResponseError:
+                return 0
+
+        deltas = [(int(recipe_id), int(views)) for recipe_id, views in redis.hgetall(FLUSHING_VIEWS_KEY).items()]
+        for start in range(0, len(deltas), batch_size):
+            batch = deltas[start:start + batch_size]
+            recipe_ids = [recipe_id for recipe_id, _ in batch]
+            Recipe.objects.filter(id__in=recipe_ids).update(
+                views=F('views') + Case(
+                    *(When(id=recipe_id, then=Value(views)) for recipe_id, views in batch),
+                    default=Value(0),
+                    output_field=PositiveBigIntegerField(),
+                ),
+            )
+            redis.hdel(FLUSHING_VIEWS_KEY, *recipe_ids)
+        redis.delete(FLUSHING_VIEWS_KEY)
+        if deltas:
+            invalidate_cache_tags(VIEWS_CACHE_TAG)
+        return len(deltas)
+    finally:
+        lock.release()
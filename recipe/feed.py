@@ -0,0 +1,212 @@
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, replace
+
+import numpy as np
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from common.precomputed import PrecomputedData
+from recipe.ingredient_index import normalize_ingredient
+
+FEED_PROFILE_KEY = 'recipe_feed:{user_id}'
+FEED_PROFILE_LOCK_KEY = 'recipe_feed_lock:{user_id}'
+FEED_PROFILE_CACHE_TIME = 60 * 60
+FEED_PROFILE_LOCK_TIMEOUT = 10
+FEED_PROFILE_LOCK_WAIT = 2
+FEED_SIZE = 200
+
+DIMENSIONS = 256
+CATEGORY_WEIGHT = 1.0
+INGREDIENTS_WEIGHT = 1.0
+
+
+def _hash_feature(feature: str) -> tuple:
+    """Maps a feature to a column and a sign, hashing is stable across processes unlike `hash`."""
+    value = zlib.crc32(feature.encode())
+    return value % DIMENSIONS, 1.0 if value & 0x80000000 else -1.0
+
+
+@dataclass(frozen=True)
+class RecipeEmbeddings:
+    version: str
+    recipe_ids: np.ndarray
+    vectors: np.ndarray
+
+    def get_rows(self, recipe_ids) -> np.ndarray:
+        """Returns rows of the vectors of the recipes, unknown recipes are skipped."""
+        recipe_ids = np.fromiter(recipe_ids, dtype=np.int64)
+        if not len(self.recipe_ids):
+            return np.empty(0, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.recipe_ids, recipe_ids), len(self.recipe_ids) - 1)
+        return rows[self.recipe_ids[rows] == recipe_ids]
+
+
+@dataclass(frozen=True)
+class FeedProfile:
+    """
+    Sum of the embeddings of the recipes bookmarked by a user along with
+    the feed ranked by it, the feed is None once the profile has changed.
+    """
+    version: str
+    vector: np.ndarray
+    bookmarked_ids: frozenset
+    recipe_ids: np.ndarray = None
+    scores: np.ndarray = None
+
+
+class RecipeFeed(PrecomputedData):
+    """
+    Ranks recipes for a user by the cosine similarity of their embeddings
+    to the profile of the user.
+
+    Recipe embeddings are float32 vectors of the category and the bag of
+    normalized ingredients, hashed into a fixed number of dimensions.
+    They are computed by a task once recipes are added, removed, moved to
+    another category or their ingredients change, and are loaded into
+    process memory by version. Profiles are cached per user for a version
+    of the embeddings and updated incrementally on new bookmarks, the feed
+    of a profile is ranked with a single matrix-vector product and cached
+    until the profile changes. Profiles are written under a per-user lock,
+    so concurrent bookmarks are not lost.
+    """
+    key = 'recipe_feed_embeddings'
+
+    def compute(self, version) -> RecipeEmbeddings:
+        from recipe.models import Ingredient, Recipe
+
+        recipe_terms = defaultdict(set)
+        for recipe_id, name in Ingredient.objects.values_list('recipe_id', 'name').iterator():
+            term = normalize_ingredient(name)
+            if term:
+                recipe_terms[recipe_id].add(term)
+
+        recipes = list(Recipe.objects.order_by('id').values_list('id', 'category_id'))
+        rows, columns, values = [], [], []
+        for row, (recipe_id, category_id) in enumerate(recipes):
+            column, sign = _hash_feature(f'category:{category_id}')
+            rows.append(row)
+            columns.append(column)
+            values.append(sign * CATEGORY_WEIGHT)
+
+            terms = recipe_terms.get(recipe_id, ())
+            for term in terms:
+                column, sign = _hash_feature(f'ingredient:{term}')
+                rows.append(row)
+                columns.append(column)
+                values.append(sign * INGREDIENTS_WEIGHT / np.sqrt(len(terms)))
+
+        vectors = np.zeros((len(recipes), DIMENSIONS), dtype=np.float32)
+        np.add.at(vectors, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)), values)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        return RecipeEmbeddings(
+            version=version,
+            recipe_ids=np.array([recipe_id for recipe_id, _ in recipes], dtype=np.int64),
+            vectors=vectors,
+        )
+
+    @staticmethod
+    def _build_profile(embeddings, user_id) -> FeedProfile:
+        from interactions.models import RecipeBookmark
+
+        bookmarked_ids = frozenset(RecipeBookmark.objects.filter(user_id=user_id).values_list('recipe_id', flat=True))
+        vector = embeddings.vectors[embeddings.get_rows(bookmarked_ids)].sum(axis=0)
+        return FeedProfile(version=embeddings.version, vector=vector, bookmarked_ids=bookmarked_ids)
+
+    @staticmethod
+    def _rank(embeddings, profile) -> FeedProfile:
+        scores = embeddings.vectors @ profile.vector
+        norm = np.linalg.norm(profile.vector)
+        if norm:
+            scores /= norm
+        if profile.bookmarked_ids:
+            scores[embeddings.get_rows(profile.bookmarked_ids)] = -np.inf
+
+        size = min(FEED_SIZE, len(scores))
+        top = np.argpartition(-scores, size - 1)[:size] if size else np.empty(0, dtype=np.int64)
+        top = top[np.lexsort((embeddings.recipe_ids[top], -scores[top]))]
+        top = top[scores[top] > 0]
+        return replace(profile, recipe_ids=embeddings.recipe_ids[top], scores=scores[top])
+
+    @staticmethod
+    def _get_profile_lock(user_id):
+        redis = get_redis_connection('default')
+        return redis.lock(
+            FEED_PROFILE_LOCK_KEY.format(user_id=user_id),
+            timeout=FEED_PROFILE_LOCK_TIMEOUT,
+            blocking_timeout=FEED_PROFILE_LOCK_WAIT,
+        )
+
+    @staticmethod
+    def _get_cached_profile(key, embeddings):
+        profile = cache.get(key)
+        if isinstance(profile, FeedProfile) and profile.version == embeddings.version:
+            return profile
+        return None
+
+    def get_feed(self, user_id) -> list:
+        """Returns (recipe id, score) pairs of the feed of the user, best first."""
+        embeddings = self.get()
+        key = FEED_PROFILE_KEY.format(user_id=user_id)
+
+        profile = self._get_cached_profile(key, embeddings)
+        if profile is None or profile.recipe_ids is None:
+            lock = self._get_profile_lock(user_id)
+            is_locked = lock.acquire()
+            try:
+                # Read again under the lock, a bookmark may have updated the profile meanwhile.
+                profile = self._get_cached_profile(key, embeddings) or self._build_profile(embeddings, user_id)
+                if profile.recipe_ids is None:
+                    profile = self._rank(embeddings, profile)
+                    # Without the lock the feed is only served, storing it could undo a concurrent update.
+                    if is_locked:
+                        cache.set(key, profile, FEED_PROFILE_CACHE_TIME)
+            finally:
+                if is_locked:
+                    lock.release()
+        return list(zip(profile.recipe_ids.tolist(), profile.scores.tolist()))
+
+    def update_profile(self, user_id, recipe_ids, added=True):
+        """
+        Adds or subtracts embeddings of the recipes to the cached profile of
+        the user, the feed is ranked again on the next request. The profile
+        is dropped if the lock can not be taken in time.
+        """
+        key = FEED_PROFILE_KEY.format(user_id=user_id)
+        lock = self._get_profile_lock(user_id)
+        if not lock.acquire():
+            cache.delete(key)
+            return
+
+        try:
+            self._update_profile(key, recipe_ids, added)
+        finally:
+            lock.release()
+
+    def _update_profile(self, key, recipe_ids, added):
+        profile = cache.get(key)
+        if not isinstance(profile, FeedProfile):
+            return
+
+        embeddings = self.get()
+        if profile.version != embeddings.version:
+            cache.delete(key)
+            return
+
+        recipe_ids = set(recipe_ids)
+        if added:
+            recipe_ids -= profile.bookmarked_ids
+            bookmarked_ids = profile.bookmarked_ids | recipe_ids
+        else:
+            recipe_ids &= profile.bookmarked_ids
+            bookmarked_ids = profile.bookmarked_ids - recipe_ids
+        delta = embeddings.vectors[embeddings.get_rows(recipe_ids)].sum(axis=0)
+        vector = profile.vector + delta if added else profile.vector - delta
+
+        profile = FeedProfile(version=profile.version, vector=vector, bookmarked_ids=bookmarked_ids)
+        cache.set(key, profile, FEED_PROFILE_CACHE_TIME)
+
+
+recipe_feed = RecipeFeed()
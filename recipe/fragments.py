@@ -0,0 +1,92 @@
+import hashlib
+import re
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.templatetags.static import static
+from django.utils.safestring import mark_safe
+
+from recipe.images import get_variant_names
+
+CARD_TEMPLATE = 'recipe/inclusion/recipe_card.html'
+PICTURE_TEMPLATE = 'recipe/inclusion/picture.html'
+CARD_KEY = 'recipe_card:{recipe_id}:{version}'
+CARD_CACHE_TIME = 3600 * 24 * 7
+
+# Per-user and frequently changing values are rendered as placeholders, so one cached
+# fragment serves every user and survives counter updates.
+IS_SAVED_PLACEHOLDER = '__card_is_saved__'
+BOOKMARK_ICON_PLACEHOLDER = '__card_bookmark_icon__'
+BOOKMARK_ICON_URL_PLACEHOLDER = '__card_bookmark_icon_url__'
+BOOKMARKS_COUNT_PLACEHOLDER = '__card_bookmarks_count__'
+VIEWS_PLACEHOLDER = '__card_views__'
+
+PLACEHOLDERS_PATTERN = re.compile('|'.join((
+    BOOKMARK_ICON_URL_PLACEHOLDER,
+    BOOKMARK_ICON_PLACEHOLDER,
+    IS_SAVED_PLACEHOLDER,
+    BOOKMARKS_COUNT_PLACEHOLDER,
+    VIEWS_PLACEHOLDER,
+)))
+
+
+@lru_cache
+def _get_template_version() -> str:
+    """Fragments rendered by a previous version of the card templates are never used."""
+    source = ''.join(get_template(name).template.source for name in (CARD_TEMPLATE, PICTURE_TEMPLATE))
+    return hashlib.md5(source.encode()).hexdigest()[:8]
+
+
+def _get_card_key(recipe) -> str:
+    content = '\0'.join((
+        _get_template_version(), recipe.slug, recipe.image.name, *sorted(get_variant_names(recipe.image_variants)),
+        recipe.name, recipe.description,
+    ))
+    return CARD_KEY.format(recipe_id=recipe.id, version=hashlib.md5(content.encode()).hexdigest())
+
+
+def _render_card(recipe) -> str:
+    return render_to_string(CARD_TEMPLATE, {
+        'recipe': recipe,
+        'is_saved': IS_SAVED_PLACEHOLDER,
+        'bookmark_icon': BOOKMARK_ICON_PLACEHOLDER,
+        'bookmark_icon_url': BOOKMARK_ICON_URL_PLACEHOLDER,
+        'bookmarks_count': BOOKMARKS_COUNT_PLACEHOLDER,
+        'views': VIEWS_PLACEHOLDER,
+    })
+
+
+def _fill_card(fragment, recipe, is_saved) -> str:
+    icon = 'bookmark-fill' if is_saved else 'bookmark'
+    values = {
+        IS_SAVED_PLACEHOLDER: 'true' if is_saved else 'false',
+        BOOKMARK_ICON_PLACEHOLDER: icon,
+        BOOKMARK_ICON_URL_PLACEHOLDER: static(f'icon/{icon}.svg'),
+        BOOKMARKS_COUNT_PLACEHOLDER: str(recipe.bookmarks_count),
+        VIEWS_PLACEHOLDER: str(recipe.views),
+    }
+    return PLACEHOLDERS_PATTERN.sub(lambda match: values[match.group()], fragment)
+
+
+def render_recipe_cards(recipes, saved_recipe_ids=()) -> list:
+    """
+    Renders cards of the recipes from cached fragments fetched with a single
+    multi-get, only the missing ones are rendered and cached.
+
+    Fragments are keyed by the recipe id and a hash of the rendered fields,
+    so edited recipes get new fragments without invalidation. The bookmark
+    state and the counters are substituted into the fragments per request.
+    """
+    keys = [_get_card_key(recipe) for recipe in recipes]
+    fragments = cache.get_many(keys)
+
+    missing = {key: _render_card(recipe) for key, recipe in zip(keys, recipes) if key not in fragments}
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIME)
+        fragments.update(missing)
+
+    return [
+        mark_safe(_fill_card(fragments[key], recipe, recipe.id in saved_recipe_ids))
+        for key, recipe in zip(keys, recipes)
+    ]
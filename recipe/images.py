@@ -0,0 +1,102 @@
+import hashlib
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Variants are resized to the width, keeping the aspect ratio, and never upscaled.
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'hero': 1200,
+}
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+FALLBACK_FORMAT = 'jpeg'
+HASH_LENGTH = 12
+# Invalidated whenever variants of any recipe are stored, so lists showing them can be validated without reading them.
+IMAGE_VARIANTS_CACHE_TAG = 'recipe.image_variants'
+
+
+def _open(image_file) -> Image.Image:
+    with image_file.open('rb'):
+        image = Image.open(image_file)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def _flatten(image, image_format) -> Image.Image:
+    """Keeps transparency for WebP, JPEG has no alpha channel so it is flattened onto white."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        if image_format != 'JPEG':
+            return image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, width, image_format, options) -> bytes:
+    if image.width > width:
+        image = image.resize((width, max(round(image.height * width / image.width), 1)), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    _flatten(image, image_format).save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _get_variant_name(source_name, variant, extension, content) -> str:
+    """Names are unique per content, so variant files can be cached by clients forever."""
+    stem = posixpath.splitext(source_name)[0]
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    return f'{stem}.{variant}.{digest}.{extension}'
+
+
+def create_image_variants(image_file) -> dict:
+    """
+    Stores resized WebP and JPEG variants of the image next to it and
+    returns their description, e.g. `{'source': name, 'variants': {
+    'card': {'width': 480, 'height': 320, 'webp': name, 'jpeg': name}}}`.
+
+    Files which already exist are kept, so creating the variants of the
+    same image again writes nothing.
+    """
+    storage = image_file.storage
+    image = _open(image_file)
+
+    variants = {}
+    for variant, width in IMAGE_VARIANTS.items():
+        width = min(width, image.width)
+        description = {'width': width, 'height': max(round(image.height * width / image.width), 1)}
+        for extension, (image_format, options) in IMAGE_FORMATS.items():
+            content = _encode(image, width, image_format, options)
+            name = _get_variant_name(image_file.name, variant, extension, content)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(content))
+            description[extension] = name
+        variants[variant] = description
+    return {'source': image_file.name, 'variants': variants}
+
+
+def get_variant_names(image_variants) -> set:
+    return {
+        description[extension]
+        for description in image_variants.get('variants', {}).values()
+        for extension in IMAGE_FORMATS if extension in description
+    }
+
+
+def delete_image_variants(storage, names):
+    for name in names:
+        storage.delete(name)
+
+
+def get_srcset(image_variants, extension, url) -> str:
+    """Returns a `srcset` of the variants in the format, widths shared by several variants are listed once."""
+    candidates = {}
+    for description in image_variants.get('variants', {}).values():
+        if extension in description:
+            candidates.setdefault(description['width'], url(description[extension]))
+    return ', '.join(f'{candidate} {width}w' for width, candidate in sorted(candidates.items()))
@@ -0,0 +1,148 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+
+from common.precomputed import PrecomputedData
+from utils.text import get_words
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'of', 'or', 'the', 'to', 'for', 'with', 'fresh', 'chopped', 'sliced', 'diced', 'minced',
+    'large', 'small', 'medium', 'g', 'gr', 'gram', 'grams', 'kg', 'ml', 'l', 'tsp', 'tbsp', 'teaspoon', 'teaspoons',
+    'tablespoon', 'tablespoons', 'cup', 'cups', 'pinch', 'piece', 'pieces', 'pcs', 'oz', 'lb', 'lbs', 'taste',
+}
+
+
+# Numbers, optionally glued to a unit, e.g. `200` or `200g`. Words like `7up` are kept.
+QUANTITY_PATTERN = re.compile(r'(\d+)([a-z]*)')
+
+
+def is_quantity(word: str) -> bool:
+    match = QUANTITY_PATTERN.fullmatch(word)
+    return match is not None and (not match.group(2) or match.group(2) in STOP_WORDS)
+
+
+def singularize(word: str) -> str:
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('oes') and len(word) > 4:
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(name: str) -> str:
+    """
+    Reduces a free-text ingredient to its vocabulary term by dropping
+    quantities, units and stop words, e.g. `200 g of Tomatoes` -> `tomato`.
+    """
+    return ' '.join(
+        singularize(word) for word in get_words(name) if word not in STOP_WORDS and not is_quantity(word)
+    )
+
+
+@dataclass(frozen=True)
+class IngredientMatch:
+    recipe_id: int
+    matched: int
+    missing: int
+
+
+@dataclass(frozen=True)
+class IngredientIndexSnapshot:
+    version: str
+    word_terms: dict
+    postings: list
+    recipe_ids: np.ndarray
+    recipe_ingredients_counts: np.ndarray
+
+
+class IngredientIndex(PrecomputedData):
+    """
+    Inverted index of a normalized ingredient vocabulary:
+    term id -> sorted array of recipe ids.
+
+    A queried ingredient matches every term that contains all of its
+    words, so `tomato` matches both `tomato` and `cherry tomato`.
+    Coverage of the whole query is counted with vectorized operations
+    over the posting arrays instead of a SQL join per ingredient.
+
+    The index is rebuilt by a task once ingredients change and is loaded
+    into the memory of every worker when its version changes, requests
+    keep using the previous index until then.
+    """
+    key = 'ingredient_index'
+
+    def compute(self, version) -> IngredientIndexSnapshot:
+        from recipe.models import Ingredient
+
+        terms = {}
+        term_recipes = defaultdict(set)
+        recipe_terms = defaultdict(set)
+        for name, recipe_id in Ingredient.objects.values_list('name', 'recipe_id').iterator():
+            term = normalize_ingredient(name)
+            if not term:
+                continue
+            term_id = terms.setdefault(term, len(terms))
+            term_recipes[term_id].add(recipe_id)
+            recipe_terms[recipe_id].add(term_id)
+
+        word_terms = defaultdict(set)
+        for term, term_id in terms.items():
+            for word in term.split():
+                word_terms[word].add(term_id)
+
+        recipe_ids = sorted(recipe_terms)
+        return IngredientIndexSnapshot(
+            version=version,
+            word_terms=dict(word_terms),
+            postings=[np.array(sorted(term_recipes[term_id]), dtype=np.int64) for term_id in range(len(terms))],
+            recipe_ids=np.array(recipe_ids, dtype=np.int64),
+            recipe_ingredients_counts=np.array(
+                [len(recipe_terms[recipe_id]) for recipe_id in recipe_ids], dtype=np.int64,
+            ),
+        )
+
+    @staticmethod
+    def _get_ingredient_recipes(snapshot, ingredient: str) -> np.ndarray:
+        """Returns the sorted ids of recipes containing a term that covers the ingredient."""
+        words = ingredient.split()
+        term_ids = set.intersection(*(snapshot.word_terms.get(word, set()) for word in words))
+        if not term_ids:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([snapshot.postings[term_id] for term_id in term_ids]))
+
+    def match(self, ingredients, require_all=False) -> list:
+        """
+        Ranks recipes by the number of matched ingredients and then
+        by the number of recipe ingredients that are still missing.
+        """
+        queried = list(dict.fromkeys(term for term in map(normalize_ingredient, ingredients) if term))
+        if not queried:
+            return []
+
+        snapshot = self.get()
+
+        postings = [self._get_ingredient_recipes(snapshot, ingredient) for ingredient in queried]
+        recipe_ids, matched = np.unique(np.concatenate(postings), return_counts=True)
+        if require_all:
+            covered = matched == len(queried)
+            recipe_ids, matched = recipe_ids[covered], matched[covered]
+        if not recipe_ids.size:
+            return []
+
+        totals = snapshot.recipe_ingredients_counts[np.searchsorted(snapshot.recipe_ids, recipe_ids)]
+        missing = np.maximum(totals - matched, 0)
+        order = np.lexsort((recipe_ids, missing, -matched))
+
+        return [
+            IngredientMatch(recipe_id=recipe_id, matched=matched_count, missing=missing_count)
+            for recipe_id, matched_count, missing_count in zip(
+                recipe_ids[order].tolist(), matched[order].tolist(), missing[order].tolist(),
+            )
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Creates resized variants of recipe images which have none or were created for a replaced image.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Creates the variants of all the images again.')
+
+    def handle(self, *args, **options):
+        generated = 0
+        recipes = Recipe.objects.order_by('id').values_list('id', 'image', 'image_variants')
+        for recipe_id, image, image_variants in recipes.iterator():
+            if image and (options['all'] or image_variants.get('source') != image):
+                generated += Recipe.objects.update_image_variants(recipe_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Created image variants of {generated} recipes.'))
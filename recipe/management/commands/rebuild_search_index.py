@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipe.models import Recipe
+from recipe.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--missing', action='store_true', help='Indexes only the recipes missing from the index.')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.setup()
+
+        recipes = Recipe.objects.order_by('id')
+        if options['missing']:
+            recipes = backend.unindexed(recipes)
+
+        indexed = 0
+        for recipe in recipes.iterator(chunk_size=options['batch_size']):
+            backend.index(recipe)
+            indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} recipes.'))
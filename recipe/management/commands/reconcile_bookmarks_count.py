@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from interactions.models import RecipeBookmark
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Recounts the denormalized bookmarks counter of recipes and fixes the drifted ones.'
+    counter_field = 'bookmarks_count'
+    counted_model = RecipeBookmark
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        fixed = 0
+
+        while True:
+            with transaction.atomic():
+                recipes = list(
+                    Recipe.objects.filter(id__gt=last_id).order_by('id').select_for_update()
+                    .only('id', self.counter_field)[:batch_size]
+                )
+                if not recipes:
+                    break
+
+                counts = dict(
+                    self.counted_model.objects.filter(recipe_id__in=[recipe.id for recipe in recipes])
+                    .values_list('recipe_id').annotate(count=Count('id')).order_by()
+                )
+                drifted = []
+                for recipe in recipes:
+                    actual_count = counts.get(recipe.id, 0)
+                    if getattr(recipe, self.counter_field) != actual_count:
+                        setattr(recipe, self.counter_field, actual_count)
+                        drifted.append(recipe)
+                Recipe.objects.bulk_update(drifted, (self.counter_field,))
+
+            fixed += len(drifted)
+            last_id = recipes[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Fixed {self.counter_field} of {fixed} recipes.'))
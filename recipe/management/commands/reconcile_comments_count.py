@@ -0,0 +1,9 @@
+from interactions.models import RecipeComment
+from recipe.management.commands.reconcile_bookmarks_count import \
+    Command as ReconcileBookmarksCountCommand
+
+
+class Command(ReconcileBookmarksCountCommand):
+    help = 'Recounts the denormalized comments counter of recipes and fixes the drifted ones.'
+    counter_field = 'comments_count'
+    counted_model = RecipeComment
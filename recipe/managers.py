@@ -1,29 +1,161 @@
 from django.db import models
-from django.db.models import Count
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
-from common.cache import get_cached_data_or_set_new
+from common.cache import get_cached_data_or_set_new, invalidate_cache_tags
+from common.snapshots import Snapshot
+from interactions.bookmark_ids import get_bookmarked_ids
+from recipe.images import (IMAGE_VARIANTS_CACHE_TAG, create_image_variants,
+                           delete_image_variants, get_variant_names)
+from recipe.search import get_search_backend
+from recipe.trending import get_trending
 
 
 class CategoryManager(models.Manager):
-    categories_cache_time = 60 * 60
+    categories_cache_time = 3600 * 24 * 7
+    local_cache_time = 10
+    snapshot_fields = ('id', 'name', 'slug')
 
-    def cached_queryset(self):
-        return get_cached_data_or_set_new('categories', self.all, self.categories_cache_time)
+    def cached_snapshot(self):
+        """Returns a cached snapshot of all the categories."""
+        return get_cached_data_or_set_new(
+            'categories',
+            lambda: Snapshot.from_queryset(self.all(), self.snapshot_fields),
+            self.categories_cache_time,
+            tags=(self.model,),
+            local_timeout=self.local_cache_time,
+        )
 
 
 class RecipeManager(models.Manager):
-    recipes_cache_time = 60 * 60
-    popular_recipes_cache_time = 3600 * 24
+    recipes_cache_time = 3600 * 24 * 7
+    popular_recipes_cache_time = 3600 * 24 * 7
+    local_cache_time = 10
+    popular_recipes_limit = 12
+    # Columns of cards and list pages, the cooking description is read only by the recipe itself.
+    snapshot_fields = ('id', 'image', 'name', 'description', 'category_id', 'slug')
+    # Stored by a task after upload, reading them per page keeps the snapshot valid meanwhile.
+    live_snapshot_fields = ('image_variants',)
+    snapshot_ordering = ('name', 'id')
+
+    def _get_snapshot(self, queryset):
+        return Snapshot.from_queryset(
+            queryset,
+            self.snapshot_fields,
+            select_related=('category',),
+            live_fields=(*self.model.counter_fields, *self.live_snapshot_fields),
+        )
 
-    def cached_queryset(self):
-        return get_cached_data_or_set_new('recipes', self.all, self.recipes_cache_time)
+    def cached_snapshot(self):
+        """Returns a cached snapshot of all the recipes with their categories, ordered by name."""
+        return get_cached_data_or_set_new(
+            'recipes',
+            lambda: self._get_snapshot(self.order_by(*self.snapshot_ordering)),
+            self.recipes_cache_time,
+            tags=(self.model, 'recipe.category'),
+            local_timeout=self.local_cache_time,
+        )
 
     def cached_popular_recipes(self):
+        """Returns a cached snapshot of the most bookmarked recipes."""
         return get_cached_data_or_set_new(
             'popular_recipes',
-            lambda: self.annotate(bookmarks_count=Count('bookmarks')).order_by('-bookmarks_count'),
+            lambda: self._get_snapshot(self.order_by('-bookmarks_count', 'id')[:self.popular_recipes_limit]),
             self.popular_recipes_cache_time,
+            tags=(self.model, 'recipe.category', 'interactions.recipebookmark'),
+            local_timeout=self.local_cache_time,
         )
 
-    def user_bookmarked_recipes(self, user):
-        return self.filter(bookmarks=user) if user.is_authenticated else None
+    def trending_recipes(self, limit, offset=0) -> list:
+        """Returns the top trending recipes with their current `trending_score`."""
+        scores = get_trending(limit, offset)
+        recipes = self.cached_snapshot().in_bulk([recipe_id for recipe_id, _ in scores])
+        trending_recipes = []
+        for recipe_id, score in scores:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.trending_score = score
+                trending_recipes.append(recipe)
+        return trending_recipes
+
+    def related_recipes(self, recipe_id, limit) -> list:
+        """Returns the recipes most often bookmarked together with the recipe with their `similarity`."""
+        from recipe.models import RelatedRecipe
+
+        scores = list(
+            RelatedRecipe.objects.filter(recipe_id=recipe_id).order_by('-score')
+            .values_list('related_recipe_id', 'score')[:limit]
+        )
+        recipes = self.cached_snapshot().in_bulk([related_recipe_id for related_recipe_id, _ in scores])
+        related_recipes = []
+        for related_recipe_id, score in scores:
+            recipe = recipes.get(related_recipe_id)
+            if recipe is not None:
+                recipe.similarity = score
+                related_recipes.append(recipe)
+        return related_recipes
+
+    def popular_recipe_ids(self, limit) -> list:
+        """Returns ids of the trending recipes topped up with the most bookmarked ones while there are few events."""
+        recipe_ids = [recipe_id for recipe_id, _ in get_trending(limit)]
+        if len(recipe_ids) < limit:
+            trending_ids = set(recipe_ids)
+            most_bookmarked = self.cached_popular_recipes().values_list('id', flat=True)
+            recipe_ids += [recipe_id for recipe_id in most_bookmarked if recipe_id not in trending_ids]
+        return recipe_ids[:limit]
+
+    def popular_recipes(self, limit) -> list:
+        """Returns the trending recipes topped up with the most bookmarked ones while there are too few events."""
+        recipe_ids = self.popular_recipe_ids(limit)
+        recipes = self.cached_snapshot().in_bulk(recipe_ids)
+        return [recipes[recipe_id] for recipe_id in recipe_ids if recipe_id in recipes]
+
+    def search(self, query):
+        """Returns recipes matching the query ordered by relevance."""
+        return get_search_backend().search(self.all(), query)
+
+    def change_bookmarks_count(self, recipe_ids, delta):
+        """Atomically shifts the denormalized bookmarks counter of the recipes by delta."""
+        return self.filter(id__in=recipe_ids).update(bookmarks_count=Greatest(F('bookmarks_count') + delta, 0))
+
+    def change_comments_count(self, recipe_ids, delta):
+        """Atomically shifts the denormalized comments counter of the recipes by delta."""
+        return self.filter(id__in=recipe_ids).update(comments_count=Greatest(F('comments_count') + delta, 0))
+
+    def touch(self, recipe_ids):
+        """Marks the recipes as updated when the data shown along with them changes, e.g. ingredients."""
+        return self.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+
+    def update_image_variants(self, recipe_id) -> bool:
+        """
+        Creates resized variants of the image of the recipe and stores their
+        description, unless the image has been replaced in the meantime.
+        Variants of the previous image are deleted.
+
+        Only this recipe changes: its `updated_at` is bumped for the ETags of
+        the recipe and cards are keyed by the variants, snapshots read them
+        per page and lists are validated by IMAGE_VARIANTS_CACHE_TAG.
+        """
+        recipe = self.filter(id=recipe_id).only('id', 'image', 'image_variants').first()
+        if recipe is None or not recipe.image or not recipe.image.storage.exists(recipe.image.name):
+            return False
+
+        image_variants = create_image_variants(recipe.image)
+        old_names, new_names = get_variant_names(recipe.image_variants), get_variant_names(image_variants)
+        updated = self.filter(id=recipe_id, image=recipe.image.name).update(
+            image_variants=image_variants, updated_at=timezone.now(),
+        )
+        if not updated:
+            delete_image_variants(recipe.image.storage, new_names - old_names)
+            return False
+
+        delete_image_variants(recipe.image.storage, old_names - new_names)
+        invalidate_cache_tags(IMAGE_VARIANTS_CACHE_TAG)
+        return True
+
+    def user_bookmarked_recipe_ids(self, user, recipe_ids) -> set:
+        """Returns ids of the given recipes bookmarked by the user, checked against their cached set."""
+        if not user.is_authenticated:
+            return set()
+        return get_bookmarked_ids(user.id, recipe_ids)
@@ -1,11 +1,15 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 
 from recipe.managers import CategoryManager, RecipeManager
+from recipe.search import SearchVectorIndex
 
 
 class Category(models.Model):
     name = models.CharField(max_length=32)
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
 
     objects = CategoryManager()
 
@@ -15,9 +19,14 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.updated_at = timezone.now()
+        return super().save(*args, **kwargs)
+
 
 class Recipe(models.Model):
     image = models.ImageField(upload_to='recipe_images')
+    image_variants = models.JSONField(default=dict, editable=False)
     name = models.CharField(max_length=32)
     description = models.CharField(max_length=128)
     cooking_description = models.TextField()
@@ -25,20 +34,50 @@ class Recipe(models.Model):
     slug = models.SlugField(unique=True)
     bookmarks = models.ManyToManyField('accounts.User', blank=True, through='interactions.RecipeBookmark')
     views = models.PositiveBigIntegerField(default=0)
+    bookmarks_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
 
     objects = RecipeManager()
 
+    # Counters are changed only by atomic updates, so `save` must not overwrite them with stale values.
+    counter_fields = ('views', 'bookmarks_count', 'comments_count')
+    # Computed from other fields by signals and tasks, so a stale instance must not overwrite them either.
+    derived_fields = ('search_vector', 'image_variants')
+
+    class Meta:
+        indexes = (SearchVectorIndex(fields=('search_vector',), name='recipe_search_vector_gin'),)
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_pk = instance.pk
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.updated_at = timezone.now()
+        # Only rows known to exist are narrowed, so copies with a cleared or new pk are still inserted.
+        is_stored = self.pk is not None and self.pk == getattr(self, '_stored_pk', None)
+        if is_stored and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred_fields = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred_fields
+                and field.name not in (*self.counter_fields, *self.derived_fields)
+            ]
+        result = super().save(*args, **kwargs)
+        self._stored_pk = self.pk
+        return result
+
     def ingredients(self):
         return self.ingredient_set.all()
 
     def comments(self):
-        return self.recipecomment_set.all().prefetch_related('author')
-
-    def bookmarks_count(self):
-        return self.bookmarks.count()
+        return self.recipecomment_set.all().select_related('author')
 
 
 class Ingredient(models.Model):
@@ -47,3 +86,21 @@ class Ingredient(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class RelatedRecipe(models.Model):
+    """Top neighbours of a recipe by co-bookmark similarity, rebuilt periodically by `build_related_recipes`."""
+    recipe = models.ForeignKey(to=Recipe, on_delete=models.CASCADE, related_name='+')
+    related_recipe = models.ForeignKey(to=Recipe, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('recipe', 'related_recipe'), name='unique_related_recipe'),
+        )
+        indexes = (
+            models.Index(fields=('recipe', '-score'), name='related_recipe_score_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id} -> {self.related_recipe_id} ({self.score:.3f})'
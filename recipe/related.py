@@ -0,0 +1,90 @@
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from common.cache import invalidate_cache_tags
+
+RELATED_RECIPES_COUNT = 10
+CHUNK_SIZE = 2048
+FETCH_CHUNK_SIZE = 10000
+INSERT_BATCH_SIZE = 5000
+# Users bookmarking almost everything say little about similarity and cost their bookmarks count squared.
+MAX_USER_BOOKMARKS = 2000
+
+
+def load_bookmarks_matrix():
+    """
+    Returns the recipe ids and a sparse binary users x recipes matrix of
+    bookmarks, whose columns follow the recipe ids.
+    """
+    from interactions.models import RecipeBookmark
+
+    pairs = RecipeBookmark.objects.values_list('user_id', 'recipe_id').order_by()
+    values = np.fromiter(chain.from_iterable(pairs.iterator(chunk_size=FETCH_CHUNK_SIZE)), dtype=np.int64)
+    user_ids, recipe_ids = values[0::2], values[1::2]
+
+    _, user_indices = np.unique(user_ids, return_inverse=True)
+    recipe_ids, recipe_indices = np.unique(recipe_ids, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(user_indices), dtype=np.float32), (user_indices, recipe_indices)),
+        shape=(user_indices.max(initial=-1) + 1, len(recipe_ids)),
+    )
+    matrix.data[:] = 1
+
+    user_bookmarks_counts = np.diff(matrix.indptr)
+    return recipe_ids, matrix[user_bookmarks_counts <= MAX_USER_BOOKMARKS]
+
+
+def _get_top_neighbours(similarities, offset, count):
+    """Returns (row, column, score) arrays of the `count` best columns of each row except the row itself."""
+    similarities = similarities.tocoo()
+    rows, columns, scores = similarities.row, similarities.col, similarities.data
+    mask = (columns != rows + offset) & (scores > 0)
+    rows, columns, scores = rows[mask], columns[mask], scores[mask]
+
+    order = np.lexsort((columns, -scores, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    row_starts = np.searchsorted(rows, rows, side='left')
+    keep = np.arange(len(rows)) - row_starts < count
+    return rows[keep] + offset, columns[keep], scores[keep]
+
+
+def compute_related_recipes(recipe_ids, matrix, count=RELATED_RECIPES_COUNT, chunk_size=CHUNK_SIZE):
+    """
+    Yields (recipe ids, related recipe ids, scores) arrays of the item-item
+    cosine similarity of the bookmarks matrix, keeping the top `count`
+    neighbours per recipe.
+
+    The similarity matrix is computed in chunks of recipes, so memory is
+    bounded by the chunk size times the number of co-bookmarked recipes.
+    """
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    normalized = (matrix @ sparse.diags(1 / norms).astype(np.float32)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    for start in range(0, len(recipe_ids), chunk_size):
+        similarities = transposed[start:start + chunk_size] @ normalized
+        rows, columns, scores = _get_top_neighbours(similarities, start, count)
+        yield recipe_ids[rows], recipe_ids[columns], scores
+
+
+def build_related_recipes(count=RELATED_RECIPES_COUNT, chunk_size=CHUNK_SIZE) -> int:
+    """Replaces the stored related recipes with the ones computed from the current bookmarks."""
+    from recipe.models import RelatedRecipe
+
+    recipe_ids, matrix = load_bookmarks_matrix()
+    created = 0
+    with transaction.atomic():
+        RelatedRecipe.objects.all().delete()
+        for chunk in compute_related_recipes(recipe_ids, matrix, count, chunk_size):
+            related_recipes = [
+                RelatedRecipe(recipe_id=recipe_id, related_recipe_id=related_recipe_id, score=score)
+                for recipe_id, related_recipe_id, score in zip(*(array.tolist() for array in chunk))
+            ]
+            RelatedRecipe.objects.bulk_create(related_recipes, batch_size=INSERT_BATCH_SIZE)
+            created += len(related_recipes)
+        transaction.on_commit(lambda: invalidate_cache_tags(RelatedRecipe))
+    return created
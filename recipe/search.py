@@ -0,0 +1,173 @@
+import re
+
+from django.contrib.postgres.indexes import GinIndex
+from django.db import connection
+from django.db.models import F, Index, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def get_recipe_search_document(recipe) -> dict:
+    """
+    Collects the searchable text of a recipe grouped by its relevance:
+    name, description, ingredient names and cooking description with
+    the html markup stripped.
+    """
+    ingredients = recipe.ingredient_set.values_list('name', flat=True)
+    return {
+        'name': recipe.name,
+        'description': recipe.description,
+        'ingredients': ' '.join(ingredients),
+        'cooking_description': strip_tags(recipe.cooking_description),
+    }
+
+
+class SearchVectorIndex(GinIndex):
+    """GIN index over `Recipe.search_vector`, other databases get a plain index as they do not search by it."""
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Index.create_sql(self, model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+
+class BaseRecipeSearchBackend:
+    """
+    Maintains a full-text index over recipes and runs ranked searches
+    against it. Results of search are ordered by relevance.
+    """
+
+    def setup(self):
+        raise NotImplementedError
+
+    def index(self, recipe):
+        raise NotImplementedError
+
+    def remove(self, recipe_id):
+        raise NotImplementedError
+
+    def search(self, queryset, query: str):
+        raise NotImplementedError
+
+    def unindexed(self, queryset):
+        """Narrows the queryset down to the recipes missing from the index, e.g. created before it."""
+        raise NotImplementedError
+
+    def index_by_id(self, recipe_id):
+        from recipe.models import Recipe
+
+        recipe = Recipe.objects.filter(id=recipe_id).first()
+        if recipe is None:
+            self.remove(recipe_id)
+        else:
+            self.index(recipe)
+
+
+class PostgresRecipeSearchBackend(BaseRecipeSearchBackend):
+    """
+    Stores weighted tsvector in `Recipe.search_vector`, which is covered
+    by a GIN index, and ranks matches with ts_rank.
+    """
+    config = 'english'
+    weights = {
+        'name': 'A',
+        'description': 'B',
+        'ingredients': 'B',
+        'cooking_description': 'C',
+    }
+
+    def setup(self):
+        """The GIN index is declared in `Recipe.Meta` and created by migrations."""
+
+    def index(self, recipe):
+        from django.contrib.postgres.search import SearchVector
+
+        from recipe.models import Recipe
+
+        document = get_recipe_search_document(recipe)
+        vectors = [
+            SearchVector(Value(text), weight=self.weights[field], config=self.config)
+            for field, text in document.items()
+        ]
+        search_vector = vectors[0]
+        for vector in vectors[1:]:
+            search_vector += vector
+        Recipe.objects.filter(id=recipe.id).update(search_vector=search_vector)
+
+    def remove(self, recipe_id):
+        """The vector is stored in the recipe row and is deleted with it."""
+
+    def unindexed(self, queryset):
+        return queryset.filter(search_vector__isnull=True)
+
+    def search(self, queryset, query: str):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, search_type='websearch', config=self.config)
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query),
+        ).order_by('-search_rank', 'name')
+
+
+class SQLiteRecipeSearchBackend(BaseRecipeSearchBackend):
+    """
+    Mirrors recipes into an FTS5 virtual table keyed by recipe id
+    and ranks matches with bm25 in the same query, so all the matches
+    are sorted and paginated by the database.
+    """
+    table_name = 'recipe_recipe_fts'
+    columns = ('name', 'description', 'ingredients', 'cooking_description')
+    column_weights = (10.0, 4.0, 4.0, 1.0)
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table_name} '
+                f'USING fts5({", ".join(self.columns)}, tokenize="porter unicode61 remove_diacritics 2")'
+            )
+
+    def index(self, recipe):
+        document = get_recipe_search_document(recipe)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table_name} WHERE rowid = %s', [recipe.id])
+            cursor.execute(
+                f'INSERT INTO {self.table_name} (rowid, {", ".join(self.columns)}) VALUES (%s, %s, %s, %s, %s)',
+                [recipe.id, *(document[column] for column in self.columns)],
+            )
+
+    def remove(self, recipe_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table_name} WHERE rowid = %s', [recipe_id])
+
+    def unindexed(self, queryset):
+        return queryset.exclude(id__in=RawSQL(f'SELECT rowid FROM {self.table_name}', []))
+
+    @staticmethod
+    def _to_match_expression(query: str) -> str:
+        """Turns user input into a prefix match of every word, e.g. `"tom"* "sou"*`."""
+        return ' '.join(f'"{word}"*' for word in WORD_PATTERN.findall(query))
+
+    def search(self, queryset, query: str):
+        match_expression = self._to_match_expression(query)
+        if not match_expression:
+            return queryset.none()
+
+        weights = ', '.join(str(weight) for weight in self.column_weights)
+        recipe_id = f'{connection.ops.quote_name(queryset.model._meta.db_table)}.{queryset.model._meta.pk.column}'
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {self.table_name} WHERE {self.table_name} MATCH %s', [match_expression]),
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT bm25({self.table_name}, {weights}) FROM {self.table_name} '
+                f'WHERE {self.table_name} MATCH %s AND rowid = {recipe_id}',
+                [match_expression],
+            ),
+        ).order_by('search_rank', 'name')
+
+
+def get_search_backend() -> BaseRecipeSearchBackend:
+    if connection.vendor == 'postgresql':
+        return PostgresRecipeSearchBackend()
+    return SQLiteRecipeSearchBackend()
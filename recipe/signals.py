@@ -0,0 +1,171 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from common.cache import invalidate_cache_tags
+from recipe.feed import recipe_feed
+from recipe.images import delete_image_variants, get_variant_names
+from recipe.ingredient_index import ingredient_index
+from recipe.models import Category, Ingredient, Recipe
+from recipe.search import get_search_backend
+from recipe.suggest import suggestion_index
+from recipe.tasks import (generate_image_variants, refresh_ingredient_index,
+                          refresh_recipe_feed, refresh_suggestion_index)
+from recipe.trending import remove_recipe as remove_trending_recipe
+
+SEARCHABLE_RECIPE_FIELDS = {'name', 'description', 'cooking_description'}
+SUGGESTED_RECIPE_FIELDS = {'name', 'slug'}
+EMBEDDED_RECIPE_FIELDS = {'category'}
+
+# Sent once with all the `instances` written by `bulk_create` or `bulk_update`, which send no `post_save`.
+post_bulk_save = Signal()
+
+
+def setup_search_index(sender, **kwargs):
+    get_search_backend().setup()
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCHABLE_RECIPE_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reindex_ingredient_recipe(sender, instance, **kwargs):
+    get_search_backend().index_by_id(instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def touch_ingredient_recipe(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Recipe.objects.touch([instance.recipe_id])
+
+
+@receiver(post_bulk_save, sender=Recipe)
+def index_recipes(sender, instances, **kwargs):
+    search_backend = get_search_backend()
+    for recipe in instances:
+        search_backend.index(recipe)
+        suggestion_index.update_recipe(recipe)
+    suggestion_index.schedule_refresh(refresh_suggestion_index)
+
+
+@receiver(post_bulk_save, sender=Ingredient)
+def index_ingredients(sender, instances, **kwargs):
+    recipe_ids = {ingredient.recipe_id for ingredient in instances}
+    Recipe.objects.touch(recipe_ids)
+
+    search_backend = get_search_backend()
+    for recipe_id in recipe_ids:
+        search_backend.index_by_id(recipe_id)
+    for ingredient in instances:
+        suggestion_index.update_ingredient(ingredient)
+    suggestion_index.schedule_refresh(refresh_suggestion_index)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_suggestions(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SUGGESTED_RECIPE_FIELDS.intersection(update_fields):
+        return
+    suggestion_index.update_recipe(instance)
+    suggestion_index.schedule_refresh(refresh_suggestion_index)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_suggestions(sender, instance, **kwargs):
+    suggestion_index.remove_recipe(instance.id)
+    suggestion_index.schedule_refresh(refresh_suggestion_index)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_trending(sender, instance, **kwargs):
+    remove_trending_recipe(instance.id)
+
+
+def _schedule_image_variants(recipe):
+    if recipe.image and recipe.image_variants.get('source') != recipe.image.name:
+        transaction.on_commit(lambda: generate_image_variants.delay(recipe.id))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _schedule_image_variants(instance)
+
+
+@receiver(post_bulk_save, sender=Recipe)
+def schedule_bulk_image_variants(sender, instances, **kwargs):
+    for recipe in instances:
+        _schedule_image_variants(recipe)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image_variants(sender, instance, **kwargs):
+    names = get_variant_names(instance.image_variants)
+    if names:
+        transaction.on_commit(lambda: delete_image_variants(instance.image.storage, names))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_suggestions(sender, instance, **kwargs):
+    suggestion_index.update_ingredient(instance)
+    suggestion_index.schedule_refresh(refresh_suggestion_index)
+
+
+@receiver(post_delete, sender=Ingredient)
+def remove_ingredient_suggestions(sender, instance, **kwargs):
+    suggestion_index.remove_ingredient(instance)
+    suggestion_index.schedule_refresh(refresh_suggestion_index)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_bulk_save, sender=Ingredient)
+def refresh_ingredient_index_on_commit(sender, **kwargs):
+    ingredient_index.schedule_refresh(refresh_ingredient_index)
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_feed_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not EMBEDDED_RECIPE_FIELDS.intersection(update_fields):
+        return
+    recipe_feed.schedule_refresh(refresh_recipe_feed)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_bulk_save, sender=Recipe)
+@receiver(post_bulk_save, sender=Ingredient)
+def refresh_recipe_feed_on_commit(sender, **kwargs):
+    recipe_feed.schedule_refresh(refresh_recipe_feed)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_bulk_save, sender=Recipe)
+@receiver(post_bulk_save, sender=Ingredient)
+def invalidate_recipe_cache(sender, **kwargs):
+    invalidate_cache_tags(sender)
+
+
+# Recipe pages show names and images of comment authors and of the current user.
+@receiver(post_save, sender='accounts.User')
+@receiver(post_delete, sender='accounts.User')
+def invalidate_user_cache(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_cache_tags(sender)
@@ -0,0 +1,228 @@
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from common.precomputed import PrecomputedData
+from utils.text import get_words
+
+
+def get_trigrams(word: str) -> set:
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class Suggestion:
+    text: str
+    type: str
+    slug: str = None
+    recipe_ids: set = field(default_factory=set)
+
+    @property
+    def weight(self) -> int:
+        return len(self.recipe_ids)
+
+    def as_dict(self) -> dict:
+        data = {'text': self.text, 'type': self.type}
+        if self.slug:
+            data['slug'] = self.slug
+        return data
+
+
+class SuggestionIndexData:
+    """
+    Words of the indexed suggestions kept in a sorted list for prefix
+    lookups and by their trigrams for fuzzy ones.
+    """
+
+    def __init__(self):
+        self.suggestions = {}
+        self.words = defaultdict(set)
+        self.sorted_words = []
+        self.trigrams = defaultdict(set)
+        self.ingredients = {}
+        self.recipe_ingredients = defaultdict(set)
+
+    @staticmethod
+    def recipe_key(recipe_id):
+        return 'recipe', recipe_id
+
+    @staticmethod
+    def ingredient_key(name):
+        return 'ingredient', ' '.join(get_words(name))
+
+    def _add_word(self, word, key):
+        if word not in self.words:
+            insort(self.sorted_words, word)
+            for trigram in get_trigrams(word):
+                self.trigrams[trigram].add(word)
+        self.words[word].add(key)
+
+    def _discard_word(self, word, key):
+        keys = self.words.get(word)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.words[word]
+            del self.sorted_words[bisect_left(self.sorted_words, word)]
+            for trigram in get_trigrams(word):
+                self.trigrams[trigram].discard(word)
+
+    def _add_suggestion(self, key, suggestion):
+        self.suggestions[key] = suggestion
+        for word in get_words(suggestion.text):
+            self._add_word(word, key)
+
+    def discard_suggestion(self, key):
+        suggestion = self.suggestions.pop(key, None)
+        if suggestion is not None:
+            for word in get_words(suggestion.text):
+                self._discard_word(word, key)
+
+    def add_recipe(self, recipe_id, name, slug):
+        key = self.recipe_key(recipe_id)
+        self.discard_suggestion(key)
+        self._add_suggestion(key, Suggestion(text=name, type='recipe', slug=slug, recipe_ids={recipe_id}))
+
+    def add_ingredient(self, ingredient_id, name, recipe_id):
+        key = self.ingredient_key(name)
+        if not key[1]:
+            return
+        suggestion = self.suggestions.get(key)
+        if suggestion is None:
+            suggestion = Suggestion(text=name, type='ingredient')
+            self._add_suggestion(key, suggestion)
+        suggestion.recipe_ids.add(recipe_id)
+        self.ingredients[ingredient_id] = (recipe_id, key)
+        self.recipe_ingredients[recipe_id].add(ingredient_id)
+
+    def discard_ingredient(self, ingredient_id):
+        recipe_id, key = self.ingredients.pop(ingredient_id, (None, None))
+        if key is None:
+            return
+        recipe_ingredients = self.recipe_ingredients[recipe_id]
+        recipe_ingredients.discard(ingredient_id)
+        if any(self.ingredients[other_id][1] == key for other_id in recipe_ingredients):
+            return
+        suggestion = self.suggestions.get(key)
+        if suggestion is not None:
+            suggestion.recipe_ids.discard(recipe_id)
+            if not suggestion.recipe_ids:
+                self.discard_suggestion(key)
+
+    def remove_recipe(self, recipe_id):
+        self.discard_suggestion(self.recipe_key(recipe_id))
+        for ingredient_id in list(self.recipe_ingredients.pop(recipe_id, ())):
+            self.discard_ingredient(ingredient_id)
+
+
+class SuggestionIndex(PrecomputedData):
+    """
+    In-memory index of recipe and ingredient names answering
+    autocomplete queries without touching the database.
+
+    Every query word is matched against the indexed words either as
+    a prefix (looked up in a sorted word list) or, to tolerate typos,
+    by trigram similarity. A suggestion has to match all query words
+    and is ranked by the average similarity of its matches.
+
+    The index is rebuilt by a task once recipes or ingredients change and
+    is loaded by every worker when its version changes. Meanwhile the
+    worker that made the change updates its own copy at once.
+    """
+    key = 'suggestion_index'
+    similarity_threshold = 0.35
+    min_fuzzy_length = 3
+    max_expansions = 256
+
+    def __init__(self):
+        super().__init__()
+        self._data_lock = threading.RLock()
+
+    def compute(self, version) -> SuggestionIndexData:
+        from recipe.models import Ingredient, Recipe
+
+        data = SuggestionIndexData()
+        for recipe_id, name, slug in Recipe.objects.values_list('id', 'name', 'slug').iterator():
+            data.add_recipe(recipe_id, name, slug)
+        for ingredient_id, name, recipe_id in Ingredient.objects.values_list('id', 'name', 'recipe_id').iterator():
+            data.add_ingredient(ingredient_id, name, recipe_id)
+        return data
+
+    def _update_local(self, update):
+        """Applies the change to the copy loaded by this process, if any, it is loaded again once refreshed."""
+        data = self.get_local()
+        if data is not None:
+            with self._data_lock:
+                update(data)
+
+    def update_recipe(self, recipe):
+        self._update_local(lambda data: data.add_recipe(recipe.id, recipe.name, recipe.slug))
+
+    def remove_recipe(self, recipe_id):
+        self._update_local(lambda data: data.remove_recipe(recipe_id))
+
+    def update_ingredient(self, ingredient):
+        def update(data):
+            data.discard_ingredient(ingredient.id)
+            data.add_ingredient(ingredient.id, ingredient.name, ingredient.recipe_id)
+
+        self._update_local(update)
+
+    def remove_ingredient(self, ingredient):
+        self._update_local(lambda data: data.discard_ingredient(ingredient.id))
+
+    def _match_word(self, data, query_word: str) -> dict:
+        """Returns indexed words similar to the query word with their similarity."""
+        matches = {}
+
+        position = bisect_left(data.sorted_words, query_word)
+        for word in data.sorted_words[position:position + self.max_expansions]:
+            if not word.startswith(query_word):
+                break
+            matches[word] = 1.0
+
+        if len(query_word) < self.min_fuzzy_length:
+            return matches
+
+        query_trigrams = get_trigrams(query_word)
+        shared_trigrams = defaultdict(int)
+        for trigram in query_trigrams:
+            for word in data.trigrams.get(trigram, ()):
+                shared_trigrams[word] += 1
+        for word, shared in shared_trigrams.items():
+            if word in matches:
+                continue
+            similarity = shared / (len(query_trigrams) + len(get_trigrams(word)) - shared)
+            if similarity >= self.similarity_threshold:
+                matches[word] = similarity
+
+        return matches
+
+    def suggest(self, query: str, limit: int = 10) -> list:
+        query_words = get_words(query)
+        if not query_words:
+            return []
+
+        data = self.get()
+        with self._data_lock:
+            scores = None
+            for query_word in query_words:
+                word_scores = defaultdict(float)
+                for word, similarity in self._match_word(data, query_word).items():
+                    for key in data.words[word]:
+                        word_scores[key] = max(word_scores[key], similarity)
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {key: score + word_scores[key] for key, score in scores.items() if key in word_scores}
+
+            suggestions = [(score / len(query_words), data.suggestions[key]) for key, score in scores.items()]
+
+        suggestions.sort(key=lambda item: (-item[0], -item[1].weight, item[1].text))
+        return [suggestion.as_dict() for _, suggestion in suggestions[:limit]]
+
+
+suggestion_index = SuggestionIndex()
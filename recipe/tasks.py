@@ -0,0 +1,44 @@
+from celery import shared_task
+
+from recipe.counters import flush_views
+from recipe.feed import recipe_feed
+from recipe.ingredient_index import ingredient_index
+from recipe.models import Recipe
+from recipe.related import build_related_recipes as build_related
+from recipe.suggest import suggestion_index
+from recipe.trending import rebase_scores
+
+
+@shared_task
+def flush_recipe_views():
+    return flush_views()
+
+
+@shared_task
+def rebase_trending_scores():
+    return rebase_scores()
+
+
+@shared_task
+def build_related_recipes():
+    return build_related()
+
+
+@shared_task
+def generate_image_variants(recipe_id):
+    return Recipe.objects.update_image_variants(recipe_id)
+
+
+@shared_task
+def refresh_ingredient_index():
+    ingredient_index.refresh()
+
+
+@shared_task
+def refresh_suggestion_index():
+    suggestion_index.refresh()
+
+
+@shared_task
+def refresh_recipe_feed():
+    recipe_feed.refresh()
@@ -0,0 +1,42 @@
+from django import template
+
+from recipe.images import FALLBACK_FORMAT, IMAGE_FORMATS, get_srcset
+
+register = template.Library()
+
+# Rendered widths of the variants in the layout, the browser picks the smallest variant covering them.
+IMAGE_SIZES = {
+    'thumbnail': '64px',
+    'card': '(min-width: 992px) 25vw, (min-width: 768px) 50vw, 100vw',
+    'hero': '(min-width: 992px) 75vw, 100vw',
+}
+
+
+@register.inclusion_tag('recipe/inclusion/picture.html')
+def recipe_picture(recipe, variant, css_class='', alt='', lazy=True, width=None, height=None):
+    """
+    Renders the image of the recipe as a `<picture>` offering all its
+    variants per format, `variant` is the fallback for older browsers.
+    The original image is rendered until the variants are created.
+    """
+    context = {
+        'src': recipe.image.url,
+        'css_class': css_class,
+        'alt': alt,
+        'lazy': lazy,
+        'width': width,
+        'height': height,
+    }
+    description = recipe.image_variants.get('variants', {}).get(variant)
+    if description is None:
+        return context
+
+    url = recipe.image.storage.url
+    context['src'] = url(description[FALLBACK_FORMAT])
+    context['srcset'] = get_srcset(recipe.image_variants, FALLBACK_FORMAT, url)
+    context['sizes'] = IMAGE_SIZES[variant]
+    context['sources'] = [
+        {'type': f'image/{extension}', 'srcset': get_srcset(recipe.image_variants, extension, url)}
+        for extension in IMAGE_FORMATS if extension != FALLBACK_FORMAT
+    ]
+    return context
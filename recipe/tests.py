@@ -1,12 +1,34 @@
+import io
+import math
+import shutil
+import tempfile
 from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
 from django.core.cache import cache
-from django.db.models import Count, Q
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django_redis import get_redis_connection
+from PIL import Image
 
+from api.recipe.serializers import RecipeSerializer
+from common.cache import get_tag_versions
+from common.tests import TestUser
+from interactions.models import RecipeComment
+from recipe import trending
+from recipe.counters import flush_views, get_pending_views, get_unique_viewers
+from recipe.feed import FEED_PROFILE_KEY, FEED_PROFILE_LOCK_KEY, recipe_feed
+from recipe.fragments import render_recipe_cards
 from recipe.models import Category, Ingredient, Recipe
+from recipe.related import (build_related_recipes, compute_related_recipes,
+                            load_bookmarks_matrix)
+from recipe.search import get_search_backend
+from recipe.views import RecipeDetailView, RecipesListView
 
 
 class RecipesListViewTestCase(TestCase):
@@ -20,14 +42,10 @@ class RecipesListViewTestCase(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertTemplateUsed(response, 'recipe/index.html')
         self.assertEqual(list(response.context_data['categories']), list(self.categories))
-        popular_recipes_cached = cache.get('popular_recipes')[:settings.COMMENTS_PAGINATE_BY]
-        if popular_recipes_cached:
-            self.assertEqual(list(response.context_data['popular_recipes']), list(popular_recipes_cached))
-        else:
-            self.assertEqual(
-                list(response.context_data['popular_recipes']),
-                list(self.queryset.annotate(bookmarks_count=Count('bookmarks')).order_by('-bookmarks_count')[:3])
-            )
+        self.assertEqual(
+            list(response.context_data['popular_recipes']),
+            Recipe.objects.popular_recipes(3)
+        )
 
     def test_list_view(self):
         path = reverse('recipe:index')
@@ -40,6 +58,13 @@ class RecipesListViewTestCase(TestCase):
         )
         self.assertEqual(response.context_data['selected_category_slug'], None)
 
+    async def test_list_view_async(self):
+        response = await self.async_client.get(reverse('recipe:index'))
+
+        self.assertTrue(RecipesListView.view_is_async)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.context_data['recipe_cards']), len(response.context_data['object_list']))
+
     def test_list_view_category(self):
         category = self.categories.first()
 
@@ -63,36 +88,519 @@ class RecipesListViewTestCase(TestCase):
         self._common_tests(response)
         self.assertEqual(
             list(response.context_data['object_list']),
-            list(
-                self.queryset.filter(Q(name__icontains=search) | Q(description__icontains=search)).order_by('name')
-            )[:settings.RECIPES_PAGINATE_BY],
+            list(Recipe.objects.search(search))[:settings.RECIPES_PAGINATE_BY],
         )
         self.assertEqual(response.context_data['selected_category_slug'], None)
 
 
+class RecipeSearchTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.recipe = Recipe.objects.first()
+
+    def test_search_by_ingredient(self):
+        Ingredient.objects.create(name='Saffron', recipe=self.recipe)
+
+        self.assertIn(self.recipe, Recipe.objects.search('saffron'))
+
+    def test_search_ranks_name_above_description(self):
+        named = Recipe.objects.exclude(id=self.recipe.id).first()
+        named.name = 'Quinoa'
+        named.save()
+        self.recipe.description = 'Served with quinoa'
+        self.recipe.save()
+
+        self.assertEqual(list(Recipe.objects.search('quinoa'))[:2], [named, self.recipe])
+
+    def test_search_page_ranked_by_database(self):
+        named = Recipe.objects.exclude(id=self.recipe.id).first()
+        named.name = 'Quinoa'
+        named.save()
+        self.recipe.description = 'Served with quinoa'
+        self.recipe.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(list(Recipe.objects.search('quinoa')[1:2]), [self.recipe])
+
+    def test_search_removes_deleted_recipe(self):
+        name = self.recipe.name
+        self.recipe.delete()
+
+        self.assertFalse(Recipe.objects.search(name).filter(name=name).exists())
+
+    def test_missing_recipes_indexed(self):
+        # Recipes created before the index have neither a search vector nor an FTS row.
+        Recipe.objects.filter(id=self.recipe.id).update(search_vector=None)
+        get_search_backend().remove(self.recipe.id)
+
+        call_command('rebuild_search_index', missing=True, stdout=io.StringIO())
+
+        self.assertIn(self.recipe, Recipe.objects.search(self.recipe.name))
+
+
 class RecipeDetailViewTestCase(TestCase):
     fixtures = ['category.json', 'recipe.json', 'ingredient.json']
 
     def setUp(self):
         self.object = Recipe.objects.first()
         self.path = reverse('recipe:detail', kwargs={'recipe_slug': self.object.slug})
-        # The address is specified in order to delete the cache created by the test.
         self.remote_addr = '127.0.0.1'
 
     def test_view(self):
-        initial_views = self.object.views
         ingredients = Ingredient.objects.filter(recipe=self.object)
 
         response = self.client.get(self.path, REMOTE_ADDR=self.remote_addr)
 
-        self.object.refresh_from_db()
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertTemplateUsed(response, 'recipe/recipe_description.html')
         self.assertEqual(response.context_data['title'], f'Special Recipe | {self.object.name}')
         self.assertEqual(response.context_data['recipe'], self.object)
         self.assertEqual(list(response.context_data['ingredients']), list(ingredients))
-        self.assertGreater(self.object.views, initial_views)
+        self.assertEqual(get_pending_views([self.object.id]), {self.object.id: 1})
+
+    async def test_view_async(self):
+        response = await self.async_client.get(self.path)
+
+        self.assertTrue(RecipeDetailView.view_is_async)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.context_data['recipe'], self.object)
+        self.assertEqual(get_pending_views([self.object.id]), {self.object.id: 1})
+
+    def test_not_found(self):
+        response = self.client.get(reverse('recipe:detail', kwargs={'recipe_slug': 'missing'}))
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_repeated_view(self):
+        self.client.get(self.path, REMOTE_ADDR=self.remote_addr)
+        self.client.get(self.path, REMOTE_ADDR=self.remote_addr)
+        self.client.get(self.path, REMOTE_ADDR='127.0.0.2')
+
+        self.assertEqual(get_pending_views([self.object.id]), {self.object.id: 2})
+        self.assertEqual(get_unique_viewers(self.object.id), 2)
+
+    def test_views_flush(self):
+        initial_views = self.object.views
+        self.client.get(self.path, REMOTE_ADDR=self.remote_addr)
+
+        flush_views()
+
+        self.object.refresh_from_db()
+        self.assertEqual(self.object.views, initial_views + 1)
+        self.assertEqual(get_pending_views([self.object.id]), {self.object.id: 0})
+
+    def _get_comments_context(self, count):
+        author = TestUser().create_user()
+        comments = [RecipeComment(recipe=self.object, author=author, text=str(number)) for number in range(count)]
+        RecipeComment.objects.bulk_create(comments)
+        Recipe.objects.change_comments_count([self.object.id], count)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.path, REMOTE_ADDR=self.remote_addr)
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+        return response.context_data
+
+    def test_has_no_more_comments(self):
+        context = self._get_comments_context(settings.COMMENTS_PAGINATE_BY)
+
+        self.assertEqual(context['comments_count'], settings.COMMENTS_PAGINATE_BY)
+        self.assertEqual(len(context['comments']), settings.COMMENTS_PAGINATE_BY)
+        self.assertFalse(context['has_more_comments'])
+
+    def test_has_more_comments(self):
+        context = self._get_comments_context(settings.COMMENTS_PAGINATE_BY + 1)
+
+        self.assertEqual(context['comments_count'], settings.COMMENTS_PAGINATE_BY + 1)
+        self.assertEqual(len(context['comments']), settings.COMMENTS_PAGINATE_BY)
+        self.assertTrue(context['has_more_comments'])
+        self.assertIn('comments_cursor', context)
 
     def tearDown(self):
-        key = f'{self.remote_addr}_{self.object.slug}'
-        cache.delete(key)
+        redis = get_redis_connection('default')
+        for key in redis.scan_iter('recipe_views:*'):
+            redis.delete(key)
+
+
+class RecipeCardsTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.recipes = list(Recipe.objects.order_by('id')[:2])
+        self.user = TestUser().create_user()
+
+    def tearDown(self):
+        cache.delete_pattern('recipe_card:*')
+
+    def test_bookmark_state_applied_per_user(self):
+        saved_card, card = render_recipe_cards(self.recipes, {self.recipes[0].id})
+
+        self.assertIn('data-is-saved="true"', saved_card)
+        self.assertIn('bookmark-fill.svg', saved_card)
+        self.assertIn('data-is-saved="false"', card)
+        self.assertNotIn('bookmark-fill.svg', card)
+
+    def test_cached_fragment_reused_with_current_counters(self):
+        render_recipe_cards(self.recipes)
+        recipe = self.recipes[0]
+        recipe.bookmarks_count = 17
+
+        with mock.patch('recipe.fragments.render_to_string') as render_to_string:
+            card, _ = render_recipe_cards(self.recipes)
+
+        render_to_string.assert_not_called()
+        self.assertIn('17 Saves', card)
+
+    def test_edited_recipe_rendered_again(self):
+        render_recipe_cards(self.recipes)
+        recipe = self.recipes[0]
+        recipe.name = 'Edited name'
+
+        card, _ = render_recipe_cards(self.recipes)
+
+        self.assertIn('Edited name', card)
+
+    def test_index_page_marks_bookmarked_recipes(self):
+        recipe = Recipe.objects.order_by('name').first()
+        recipe.bookmarks.add(self.user, through_defaults=None)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('recipe:index'))
+
+        self.assertContains(response, f'data-recipe-id="{recipe.id}"\n              data-is-saved="true"')
+
+
+class RecipeDetailConditionalGetTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.recipe = Recipe.objects.first()
+        self.path = reverse('recipe:detail', kwargs={'recipe_slug': self.recipe.slug})
+
+    def tearDown(self):
+        redis = get_redis_connection('default')
+        for key in redis.scan_iter('recipe_views:*'):
+            redis.delete(key)
+
+    def test_not_modified(self):
+        response = self.client.get(self.path)
+
+        not_modified = self.client.get(self.path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(not_modified.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_modified_by_comment(self):
+        response = self.client.get(self.path)
+        user = TestUser().create_user()
+
+        RecipeComment.objects.create(recipe=self.recipe, author=user, text='Comment')
+        modified = self.client.get(self.path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, HTTPStatus.OK)
+
+    def test_modified_by_author_profile(self):
+        user = TestUser().create_user()
+        RecipeComment.objects.create(recipe=self.recipe, author=user, text='Comment')
+        response = self.client.get(self.path)
+
+        user.username = 'renamed'
+        user.save()
+        modified = self.client.get(self.path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, HTTPStatus.OK)
+        self.assertContains(modified, 'renamed')
+
+
+class TrendingTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.first_recipe, self.second_recipe = Recipe.objects.order_by('id')[:2]
+        self.now = 1_700_000_000
+        self._clear_trending()
+
+    def tearDown(self):
+        self._clear_trending()
+
+    @staticmethod
+    def _clear_trending():
+        get_redis_connection('default').delete(trending.TRENDING_SCORES_KEY, trending.TRENDING_EPOCH_KEY)
+
+    def _record_event(self, recipe, weight, half_lives=0):
+        with mock.patch('recipe.trending.time.time', return_value=self.now + half_lives * trending.HALF_LIFE_SECONDS):
+            trending.record_event(recipe.id, weight)
+
+    def _get_trending(self, half_lives=0):
+        with mock.patch('recipe.trending.time.time', return_value=self.now + half_lives * trending.HALF_LIFE_SECONDS):
+            return trending.get_trending(10)
+
+    def test_old_events_decay(self):
+        self._record_event(self.first_recipe, 8)
+        self._record_event(self.second_recipe, 2, half_lives=1)
+
+        scores = self._get_trending(half_lives=2)
+
+        self.assertEqual(scores, [(self.first_recipe.id, 2.0), (self.second_recipe.id, 1.0)])
+
+    def test_rebase_keeps_scores(self):
+        self._record_event(self.first_recipe, 8)
+        self._record_event(self.second_recipe, 1, half_lives=1)
+        scores = self._get_trending(half_lives=3)
+
+        with mock.patch('recipe.trending.time.time', return_value=self.now + 3 * trending.HALF_LIFE_SECONDS):
+            trending.rebase_scores()
+
+        self.assertEqual(self._get_trending(half_lives=3), scores)
+
+    def test_popular_recipes_topped_up(self):
+        self._record_event(self.second_recipe, 1)
+
+        popular_recipes = Recipe.objects.popular_recipes(3)
+
+        self.assertEqual(popular_recipes[0], self.second_recipe)
+        self.assertEqual(len(popular_recipes), 3)
+        self.assertEqual(len(set(popular_recipes)), 3)
+
+
+class RelatedRecipesTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json']
+
+    def setUp(self):
+        self.recipes = list(Recipe.objects.order_by('id')[:3])
+        first_recipe, second_recipe, third_recipe = self.recipes
+        bookmarks = {
+            'first': (first_recipe, second_recipe),
+            'second': (first_recipe, second_recipe),
+            'third': (first_recipe, third_recipe),
+        }
+        for username, recipes in bookmarks.items():
+            user = TestUser().create_user(username=username, email=f'{username}@mail.com')
+            for recipe in recipes:
+                recipe.bookmarks.add(user, through_defaults=None)
+
+    def test_ranked_by_cosine_similarity(self):
+        build_related_recipes()
+
+        related_recipes = Recipe.objects.related_recipes(self.recipes[0].id, 10)
+
+        self.assertEqual(related_recipes, self.recipes[1:])
+        self.assertAlmostEqual(related_recipes[0].similarity, 2 / math.sqrt(6), places=5)
+        self.assertAlmostEqual(related_recipes[1].similarity, 1 / math.sqrt(3), places=5)
+
+    def test_chunks_give_same_result(self):
+        recipe_ids, matrix = load_bookmarks_matrix()
+
+        chunked = [list(map(list, chunk)) for chunk in compute_related_recipes(recipe_ids, matrix, chunk_size=1)]
+        whole = [list(map(list, chunk)) for chunk in compute_related_recipes(recipe_ids, matrix)]
+
+        self.assertEqual(
+            [row for chunk in chunked for row in zip(*chunk)],
+            [row for chunk in whole for row in zip(*chunk)],
+        )
+
+    def test_detail_page_shows_related_recipes(self):
+        build_related_recipes()
+
+        response = self.client.get(reverse('recipe:detail', kwargs={'recipe_slug': self.recipes[0].slug}))
+
+        self.assertEqual(response.context_data['related_recipes'], self.recipes[1:])
+
+    def test_detail_page_modified_by_related_recipe_rename(self):
+        build_related_recipes()
+        path = reverse('recipe:detail', kwargs={'recipe_slug': self.recipes[0].slug})
+        response = self.client.get(path)
+
+        self.recipes[1].name = 'Renamed'
+        self.recipes[1].save()
+        modified = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, HTTPStatus.OK)
+        self.assertContains(modified, 'Renamed')
+
+    def test_detail_page_modified_by_related_recipe_delete(self):
+        build_related_recipes()
+        path = reverse('recipe:detail', kwargs={'recipe_slug': self.recipes[0].slug})
+        response = self.client.get(path)
+
+        self.recipes[2].delete()
+        modified = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, HTTPStatus.OK)
+        self.assertEqual(modified.context_data['related_recipes'], self.recipes[1:2])
+
+    def tearDown(self):
+        redis = get_redis_connection('default')
+        for key in redis.scan_iter('recipe_views:*'):
+            redis.delete(key)
+
+
+class RecipeFeedTestCase(TestCase):
+    fixtures = ['category.json', 'recipe.json', 'ingredient.json']
+
+    def setUp(self):
+        self.user = TestUser().create_user()
+        self.bookmarked_recipe, self.similar_recipe = Recipe.objects.order_by('id')[:2]
+        self.similar_recipe.category = self.bookmarked_recipe.category
+        self.similar_recipe.save()
+        self.similar_recipe.ingredient_set.all().delete()
+        for ingredient in self.bookmarked_recipe.ingredients():
+            Ingredient.objects.create(name=ingredient.name, recipe=self.similar_recipe)
+        self.bookmarked_recipe.bookmarks.add(self.user, through_defaults=None)
+        recipe_feed.refresh()
+
+    def tearDown(self):
+        cache.delete_pattern('recipe_feed:*')
+
+    def test_similar_recipes_ranked_first(self):
+        feed = recipe_feed.get_feed(self.user.id)
+
+        recipe_id, score = feed[0]
+        self.assertEqual(recipe_id, self.similar_recipe.id)
+        self.assertAlmostEqual(score, 1, places=5)
+        self.assertNotIn(self.bookmarked_recipe.id, dict(feed))
+
+    def test_embeddings_not_computed_by_requests(self):
+        recipe_feed.get_feed(self.user.id)
+
+        with mock.patch.object(recipe_feed, 'compute') as compute:
+            self.similar_recipe.save()
+            Recipe.objects.update_image_variants(self.similar_recipe.id)
+            recipe_feed.get_feed(self.user.id)
+
+        compute.assert_not_called()
+
+    def test_profile_updated_incrementally(self):
+        recipe_feed.get_feed(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.similar_recipe.bookmarks.add(self.user, through_defaults=None)
+        with self.assertNumQueries(0):
+            feed = recipe_feed.get_feed(self.user.id)
+
+        self.assertNotIn(self.similar_recipe.id, dict(feed))
+        self.assertEqual(
+            cache.get(FEED_PROFILE_KEY.format(user_id=self.user.id)).bookmarked_ids,
+            {self.bookmarked_recipe.id, self.similar_recipe.id},
+        )
+
+    def test_profile_dropped_while_locked(self):
+        recipe_feed.get_feed(self.user.id)
+        self.similar_recipe.bookmarks.add(self.user, through_defaults=None)
+        # Another worker holds the profile of the user for longer than an update waits.
+        lock = get_redis_connection('default').lock(FEED_PROFILE_LOCK_KEY.format(user_id=self.user.id), timeout=10)
+        lock.acquire()
+        try:
+            with mock.patch('recipe.feed.FEED_PROFILE_LOCK_WAIT', 0.1):
+                recipe_feed.update_profile(self.user.id, [self.similar_recipe.id])
+        finally:
+            lock.release()
+
+        self.assertIsNone(cache.get(FEED_PROFILE_KEY.format(user_id=self.user.id)))
+        self.assertNotIn(self.similar_recipe.id, dict(recipe_feed.get_feed(self.user.id)))
+
+
+class RecipeImageVariantsTestCase(TestCase):
+    fixtures = ['category.json']
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.recipe = Recipe.objects.create(
+            image=self._get_image('photo.jpg', 2000, 1000),
+            name='Pancakes',
+            description='Pancakes',
+            cooking_description='Fry.',
+            category=Category.objects.first(),
+            slug='pancakes',
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    @staticmethod
+    def _get_image(name, width, height):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), 'orange').save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_variants_created(self):
+        self.assertTrue(Recipe.objects.update_image_variants(self.recipe.id))
+
+        self.recipe.refresh_from_db()
+        variants = self.recipe.image_variants['variants']
+        self.assertEqual(self.recipe.image_variants['source'], self.recipe.image.name)
+        self.assertEqual(
+            {variant: (description['width'], description['height']) for variant, description in variants.items()},
+            {'thumbnail': (160, 80), 'card': (480, 240), 'hero': (1200, 600)},
+        )
+        with self.recipe.image.storage.open(variants['card']['webp']) as file:
+            self.assertEqual(Image.open(file).format, 'WEBP')
+
+    def test_small_image_not_upscaled(self):
+        self.recipe.image = self._get_image('small.jpg', 300, 200)
+        self.recipe.save()
+
+        Recipe.objects.update_image_variants(self.recipe.id)
+
+        self.recipe.refresh_from_db()
+        srcset = RecipeSerializer(self.recipe).data['image_srcset']
+        self.assertEqual([candidate.split()[-1] for candidate in srcset['webp'].split(', ')], ['160w', '300w'])
+
+    def test_replaced_image_variants_deleted(self):
+        Recipe.objects.update_image_variants(self.recipe.id)
+        self.recipe.refresh_from_db()
+        old_names = [description['jpeg'] for description in self.recipe.image_variants['variants'].values()]
+
+        self.recipe.image = self._get_image('other.jpg', 1000, 1000)
+        self.recipe.save()
+        Recipe.objects.update_image_variants(self.recipe.id)
+
+        storage = self.recipe.image.storage
+        self.assertFalse([name for name in old_names if storage.exists(name)])
+
+    def test_save_does_not_overwrite_variants(self):
+        stale_recipe = Recipe.objects.get(id=self.recipe.id)
+        Recipe.objects.update_image_variants(self.recipe.id)
+
+        stale_recipe.save()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants['source'], self.recipe.image.name)
+
+    def test_copy_saved(self):
+        copy = Recipe.objects.get(id=self.recipe.id)
+        copy.pk = None
+        copy.slug = f'{self.recipe.slug}-copy'
+
+        copy.save()
+
+        self.assertNotEqual(copy.pk, self.recipe.pk)
+        self.assertEqual(Recipe.objects.get(pk=copy.pk).image, self.recipe.image)
+        self.assertTrue(Recipe.objects.filter(pk=self.recipe.pk).exists())
+
+    def test_scheduled_on_upload_only(self):
+        with mock.patch('recipe.signals.generate_image_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.recipe.image = self._get_image('new.jpg', 800, 600)
+                self.recipe.save()
+            Recipe.objects.update_image_variants(self.recipe.id)
+            self.recipe.refresh_from_db()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.recipe.name = 'Crepes'
+                self.recipe.save()
+
+        delay.assert_called_once_with(self.recipe.id)
+
+    def test_card_offers_variants(self):
+        Recipe.objects.cached_snapshot()
+        recipe_version = get_tag_versions(Recipe)
+        Recipe.objects.update_image_variants(self.recipe.id)
+
+        self.assertEqual(get_tag_versions(Recipe), recipe_version)
+        recipe = Recipe.objects.cached_snapshot().in_bulk([self.recipe.id])[self.recipe.id]
+        card = render_recipe_cards([recipe])[0]
+
+        self.assertIn('type="image/webp"', card)
+        self.assertIn(recipe.image.storage.url(recipe.image_variants['variants']['card']['jpeg']), card)
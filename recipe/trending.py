@@ -0,0 +1,67 @@
+import time
+
+from django_redis import get_redis_connection
+
+TRENDING_SCORES_KEY = 'recipe_trending:scores'
+TRENDING_EPOCH_KEY = 'recipe_trending:epoch'
+
+HALF_LIFE_SECONDS = 60 * 60 * 24
+VIEW_WEIGHT = 1
+BOOKMARK_WEIGHT = 5
+MIN_SCORE = 0.01
+
+# Scores are kept relative to an epoch: an event adds weight * 2 ^ (age of the epoch / half-life),
+# which ranks recipes exactly as decaying all the scores over time would, without touching them.
+RECORD_EVENT_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    epoch = tonumber(ARGV[2])
+    redis.call('SET', KEYS[2], epoch)
+end
+local increment = tonumber(ARGV[3]) * math.pow(2, (tonumber(ARGV[2]) - epoch) / tonumber(ARGV[4]))
+return redis.call('ZINCRBY', KEYS[1], increment, ARGV[1])
+"""
+
+# Moves the epoch to now, so the stored scores stay small, and drops the faded recipes.
+REBASE_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    return 0
+end
+local factor = math.pow(2, (epoch - tonumber(ARGV[1])) / tonumber(ARGV[2]))
+redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', factor)
+redis.call('SET', KEYS[2], ARGV[1])
+return redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+"""
+
+
+def record_event(recipe_id, weight):
+    """Adds a view, bookmark or any other weighted event of the recipe to its trending score."""
+    script = get_redis_connection('default').register_script(RECORD_EVENT_SCRIPT)
+    script(keys=(TRENDING_SCORES_KEY, TRENDING_EPOCH_KEY), args=(recipe_id, time.time(), weight, HALF_LIFE_SECONDS))
+
+
+def get_trending(limit, offset=0) -> list:
+    """
+    Returns (recipe id, score) pairs of the top trending recipes, scores
+    are decayed to the current moment. The read costs O(log n + limit).
+    """
+    redis = get_redis_connection('default')
+    with redis.pipeline(transaction=True) as pipeline:
+        pipeline.get(TRENDING_EPOCH_KEY)
+        pipeline.zrevrange(TRENDING_SCORES_KEY, offset, offset + limit - 1, withscores=True)
+        epoch, scores = pipeline.execute()
+    if epoch is None:
+        return []
+    factor = 2 ** ((float(epoch) - time.time()) / HALF_LIFE_SECONDS)
+    return [(int(recipe_id), score * factor) for recipe_id, score in scores]
+
+
+def remove_recipe(recipe_id):
+    get_redis_connection('default').zrem(TRENDING_SCORES_KEY, recipe_id)
+
+
+def rebase_scores() -> int:
+    """Rescales the stored scores to the current moment and returns the number of dropped recipes."""
+    script = get_redis_connection('default').register_script(REBASE_SCRIPT)
+    return script(keys=(TRENDING_SCORES_KEY, TRENDING_EPOCH_KEY), args=(time.time(), HALF_LIFE_SECONDS, MIN_SCORE))
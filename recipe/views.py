@@ -1,15 +1,27 @@
+import asyncio
+
 from django.conf import settings
-from django.core.cache import cache
-from django.db.models import Q
+from django.contrib.auth import get_user_model
+from django.http import Http404
+from django.middleware.csrf import get_token
 from django.urls import reverse
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import FormMixin
 from django.views.generic.list import ListView
 
+from api.recipe.pagination import CommentPageNumberPagination
+from common.cache import get_tag_versions
+from common.concurrency import aget_user, to_db_thread, to_thread
+from common.conditional import (get_not_modified_response, make_etag,
+                                set_validators)
 from common.views import TitleMixin
 from interactions.forms import RecipeCommentForm
+from interactions.models import RecipeComment
+from recipe.counters import apply_pending_views, register_view
 from recipe.forms import SearchForm
-from recipe.models import Category, Recipe
+from recipe.fragments import render_recipe_cards
+from recipe.images import IMAGE_VARIANTS_CACHE_TAG
+from recipe.models import Category, Recipe, RelatedRecipe
 
 
 class RecipesListView(TitleMixin, ListView):
@@ -18,19 +30,40 @@ class RecipesListView(TitleMixin, ListView):
     ordering = ('name',)
     title = 'Special Recipe | Recipes'
     paginate_by = settings.RECIPES_PAGINATE_BY
+    popular_recipes_count = 3
+
+    async def get(self, request, *args, **kwargs):
+        # The page, the sidebar and the user do not depend on each other.
+        context, categories_context, popular_recipes, user = await asyncio.gather(
+            to_db_thread(self.get_page_context),
+            to_db_thread(self.get_categories_context),
+            to_db_thread(self.model.objects.popular_recipes, self.popular_recipes_count),
+            aget_user(request),
+        )
+        recipe_ids = [recipe.id for recipe in context['object_list'] if recipe is not None]
+        recipes, saved_recipe_ids = await asyncio.gather(
+            to_thread(apply_pending_views, context['object_list']),
+            to_db_thread(self.model.objects.user_bookmarked_recipe_ids, user, recipe_ids),
+        )
+
+        context.update(categories_context)
+        context['popular_recipes'] = popular_recipes
+        context['object_list'] = recipes
+        context['recipe_cards'] = await to_thread(render_recipe_cards, recipes, saved_recipe_ids)
+        return self.render_to_response(context)
 
     def get_queryset(self):
-        queryset = self.model.objects.cached_queryset()
-
         selected_category_slug = self.kwargs.get('category_slug')
         search = self.request.GET.get('search')
 
         if search:
-            queryset = queryset.filter(Q(name__icontains=search) | Q(description__icontains=search))
-        elif selected_category_slug:
+            return self.model.objects.search(search)
+
+        queryset = self.model.objects.cached_snapshot()
+        if selected_category_slug:
             queryset = queryset.filter(category__slug=selected_category_slug)
 
-        return queryset.prefetch_related('bookmarks').order_by(*self.ordering)
+        return queryset.order_by(*self.ordering)
 
     def get_paginator_url(self):
         selected_category_slug = self.kwargs.get('category_slug')
@@ -42,19 +75,25 @@ class RecipesListView(TitleMixin, ListView):
             return f'?search={search}&page='
         return reverse('recipe:index') + '?page='
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super().get_context_data()
+    def get_page_context(self) -> dict:
+        """Returns the context of the current page with its recipes loaded."""
+        self.object_list = self.get_queryset()
+        context = self.get_context_data()
+        context['object_list'] = list(context['object_list'])
+        return context
 
-        categories = Category.objects.cached_queryset().order_by('name')
-        popular_recipes = self.model.objects.cached_popular_recipes()
+    def get_categories_context(self) -> dict:
+        categories = Category.objects.cached_snapshot().order_by('name')
+        return {
+            'categories': categories[:settings.CATEGORIES_PAGINATE_BY],
+            'has_more_categories': categories.count() > settings.CATEGORIES_PAGINATE_BY,
+        }
 
-        context['categories'] = categories[:settings.CATEGORIES_PAGINATE_BY]
-        context['popular_recipes'] = popular_recipes[:3]
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data()
 
-        context['has_more_categories'] = categories.count() > settings.CATEGORIES_PAGINATE_BY
         context['selected_category_slug'] = self.kwargs.get('category_slug')
         context['paginator_url'] = self.get_paginator_url()
-        context['user_bookmarks'] = self.model.objects.user_bookmarked_recipes(self.request.user)
         context['form'] = SearchForm(initial={'search': self.request.GET.get('search')})
 
         return context
@@ -65,37 +104,68 @@ class RecipeDetailView(FormMixin, DetailView):
     slug_url_kwarg = 'recipe_slug'
     template_name = 'recipe/recipe_description.html'
     form_class = RecipeCommentForm
-
-    def _has_viewed(self, request):
-        remote_addr = request.META.get('REMOTE_ADDR')
-        recipe_slug = self.kwargs.get(self.slug_url_kwarg)
-
-        key = f'{remote_addr}_{recipe_slug}'
-        has_viewed = cache.get(key)
-
-        if not has_viewed:
-            cache.set(key, True, 60)
-        return has_viewed
-
-    def _increment_views(self):
-        self.object.views += 1
-        self.object.save()
-
-    def get(self, request, *args, **kwargs):
-        response = super().get(request, *args, **kwargs)
-        if not self._has_viewed(request):
-            self._increment_views()
-        return response
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data()
-
-        comments = self.object.comments().order_by('-created_date')
-        comments_count = comments.count()
-
-        context['comments'] = comments[:settings.COMMENTS_PAGINATE_BY]
-        context['comments_count'] = comments_count
-        context['has_more_comments'] = comments_count > settings.COMMENTS_PAGINATE_BY
-        context['ingredients'] = self.object.ingredients()
+    related_recipes_count = 4
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        _, tag_versions, user = await asyncio.gather(
+            to_thread(register_view, self.object.id, request.META.get('REMOTE_ADDR', '')),
+            to_thread(get_tag_versions, Recipe, IMAGE_VARIANTS_CACHE_TAG, RecipeComment, RelatedRecipe, get_user_model()),
+            aget_user(request),
+        )
+
+        etag = self.get_etag(tag_versions, user)
+        response = get_not_modified_response(request, etag)
+        if response is None:
+            comments, ingredients, related_recipes = await asyncio.gather(
+                self.aget_comments(),
+                self.aget_ingredients(),
+                to_db_thread(self.model.objects.related_recipes, self.object.id, self.related_recipes_count),
+            )
+            response = self.render_to_response(self.get_context_data(
+                object=self.object, comments=comments, ingredients=ingredients, related_recipes=related_recipes,
+            ))
+        return set_validators(response, etag)
+
+    async def aget_object(self):
+        try:
+            return await self.model.objects.aget(slug=self.kwargs[self.slug_url_kwarg])
+        except self.model.DoesNotExist:
+            raise Http404(f'No {self.model._meta.verbose_name} found matching the query')
+
+    async def aget_comments(self) -> list:
+        # One extra row tells whether there are more comments without counting them.
+        comments = self.object.comments().order_by(*CommentPageNumberPagination.keyset_ordering)
+        return [comment async for comment in comments[:settings.COMMENTS_PAGINATE_BY + 1]]
+
+    async def aget_ingredients(self) -> list:
+        return [ingredient async for ingredient in self.object.ingredients()]
+
+    def get_etag(self, tag_versions, user):
+        """
+        The page shows the recipe, its comments, profiles of their authors
+        and of the current user, names and images of related recipes, and
+        user specific parts, e.g. the CSRF token.
+        """
+        get_token(self.request)
+        return make_etag(
+            self.object.pk,
+            self.object.updated_at,
+            tag_versions,
+            user.pk,
+            self.request.META.get('CSRF_COOKIE'),
+        )
+
+    def get_context_data(self, *, comments=(), ingredients=(), related_recipes=(), **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        first_comments = comments[:settings.COMMENTS_PAGINATE_BY]
+        context['comments'] = first_comments
+        context['comments_count'] = self.object.comments_count
+        context['has_more_comments'] = len(comments) > settings.COMMENTS_PAGINATE_BY
+        if context['has_more_comments']:
+            context['comments_cursor'] = CommentPageNumberPagination().get_cursor(first_comments[-1])
+        context['ingredients'] = ingredients
+        context['related_recipes'] = related_recipes
         context['title'] = f'Special Recipe | {self.object.name}'
         return context
@@ -161,8 +161,7 @@ function showMoreCategories() {
 function showMoreComments() {
     const commentsWrp = document.getElementById('comments-wrp');
 
-    const page = parseInt(showMoreCommentsButton.dataset.page);
-    const recipeId = parseInt(showMoreCommentsButton.dataset.recipeId);
+    const url = showMoreCommentsButton.dataset.nextUrl;
 
     const loadingSpinnerWrp = createLoadingSpinnerWrp(true);
     const loadingSpinner = createLoadingSpinner(false, 'primary');
@@ -170,7 +169,6 @@ function showMoreComments() {
     loadingSpinnerWrp.append(loadingSpinner);
     commentsWrp.insertAdjacentElement('afterend', loadingSpinnerWrp);
 
-    const url = `/api/v1/comments/?page=${page}&recipe_id=${recipeId}`;
     const requestOptions = {
         'method': 'GET',
         'headers': {
@@ -200,7 +198,7 @@ function showMoreComments() {
             if (jsonResponse.next === null) {
                 showMoreCommentsButton.closest('div').remove();
             } else {
-                showMoreCommentsButton.dataset.page = (page + 1).toString();
+                showMoreCommentsButton.dataset.nextUrl = jsonResponse.next;
             }
         })
         .catch(error => {
@@ -0,0 +1,30 @@
+import re
+import unicodedata
+from typing import List
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercases the text and strips diacritics.
+
+     Examples
+    --------
+    >>> normalize('Crème Brûlée')
+    'creme brulee'
+    """
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def get_words(text: str) -> List[str]:
+    """
+    Splits the normalized text into words, punctuation is dropped.
+
+     Examples
+    --------
+    >>> get_words('2 Crème-Brûlées!')
+    ['2', 'creme', 'brulees']
+    """
+    return WORD_PATTERN.findall(normalize(text))